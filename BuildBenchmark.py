@@ -0,0 +1,154 @@
+import os, sys, json, time, platform, subprocess
+
+# Benchmarks the build orchestrator on a synthetic solution of N groups x
+# M projects x K sources. Every phase goes through BuildInfo.BuildSolutions
+# and the results are written as sorted JSON so revisions can be diffed.
+
+benchmark_version = 1
+
+def GetProjectName(group, index):
+  return "G%02dP%03d" % (group, index)
+
+def GetProjectLibs(group, index):
+  libs = []
+  if index > 0: libs.append(GetProjectName(group, index - 1))
+  if group > 0: libs.append(GetProjectName(group - 1, index))
+  return libs
+
+def WriteFile(path, content):
+  if not os.path.isdir(os.path.dirname(path)): os.makedirs(os.path.dirname(path))
+  with open(path, "w", encoding = "utf-8") as file:
+    file.write(content)
+
+def GenerateSolution(root, groups, projects, sources, gens = 1, pch = True, unity = True):
+  projs = {}
+  for group in range(groups):
+    group_name = "Group%02d" % group
+    projs[group_name] = {}
+    for index in range(projects):
+      name = GetProjectName(group, index)
+      libs = GetProjectLibs(group, index)
+      proj = { "type" : "lib", "libs" : libs }
+      if pch and 0 == index % 2: proj["pch"] = "%s.h" % name
+      if unity and 1 == index % 3: proj["unity"] = 8
+      projs[group_name][name] = proj
+      proj_dir = "%s/%s/%s" % (root, group_name, name)
+      header = ["#pragma once", "#include <string>", "#include <vector>", ""]
+      header += ["int %s_%d(int value);" % (name, source) for source in range(sources)]
+      WriteFile("%s/%s.h" % (proj_dir, name), "\n".join(header) + "\n")
+      for source in range(sources):
+        lines = ["#include \"%s.h\"" % name]
+        lines += ["#include \"../../Group%02d/%s/%s.h\"" % (int(lib[1:3]), lib, lib) for lib in libs]
+        lines += ["", "int %s_%d(int value)" % (name, source), "{", "  std::vector<std::string> items(value, \"%s\");" % name]
+        lines += ["  value += %s_0(value);" % lib for lib in libs]
+        lines += ["  return value + static_cast<int>(items.size());", "}"]
+        WriteFile("%s/%s_%d.cpp" % (proj_dir, name, source), "\n".join(lines) + "\n")
+  if gens > 0:
+    projs["Tools"] = {}
+    for gen in range(gens):
+      name = "Gen%02d" % gen
+      projs["Tools"][name] = { "type" : "gen" }
+      WriteFile("%s/Tools/%s/CMakeLists.txt" % (root, name), "\n".join([
+        "CMAKE_MINIMUM_REQUIRED(VERSION 3.9)",
+        "PROJECT(%s NONE)" % name,
+        "FILE(WRITE ${CMAKE_BINARY_DIR}/%s.txt \"%d\")" % (name, gen)]) + "\n")
+  WriteFile("%s/solution.py" % root, "name = \"Bench\"\nprojects = %s\n" % json.dumps(projs, indent = 2, sort_keys = True))
+
+def GetStats(runs):
+  values = sorted(runs)
+  return {
+    "runs" : [round(value, 3) for value in runs],
+    "min" : round(values[0], 3),
+    "median" : round(values[len(values) // 2], 3),
+    "max" : round(values[-1], 3)
+  }
+
+def GetPhases():
+  import BuildUtil
+  phases = {}
+  for event in BuildUtil.build_trace.events:
+    phases[event["phase"]] = phases.get(event["phase"], 0.0) + event["end"] - event["start"]
+  return phases
+
+def RunBenchmark(work_dir, groups, projects, sources, gens = 1, pch = True, unity = True, repeat = 3, build_info_args = None):
+  import BuildUtil
+  root = "%s/Bench" % work_dir
+  if os.path.isdir(root): BuildUtil.EnsureDirectory(root, True, False)
+  GenerateSolution(root, groups, projects, sources, gens, pch, unity)
+  os.environ.pop("VENUS_ARTIFACT_CACHE", None)
+  args = { "build_history" : "" }
+  args.update(build_info_args or {})
+  curdir = os.path.abspath(os.curdir)
+  os.chdir(work_dir)
+  try:
+    build_info = BuildUtil.BuildInfo({ "VENUS_BUILD_PATH" : os.path.dirname(os.path.abspath(__file__)) }, **args)
+    solution = BuildUtil.LoadSolution("%s/solution.py" % root)
+    results = {}
+
+    def Measure(name, func, prepare = None):
+      runs = []
+      phases = {}
+      for _ in range(repeat):
+        if prepare: prepare()
+        start = time.time()
+        func()
+        runs.append(time.time() - start)
+        for phase, duration in GetPhases().items():
+          phases.setdefault(phase, []).append(duration)
+      results[name] = GetStats(runs)
+      results[name]["phases"] = dict([(phase, GetStats(values)["median"]) for phase, values in phases.items()])
+
+    BuildUtil.build_trace.Reset()
+    Measure("gen_cmake", lambda: solution.GenCMake("%s/bench_cmake" % work_dir, True))
+    Measure("configure", lambda: build_info.BuildSolutions("Bench", need_clear = True))
+    Measure("clean_build", lambda: build_info.BuildSolutions("Bench", need_clear = True, need_build = True))
+    Measure("noop_build", lambda: build_info.BuildSolutions("Bench", need_build = True))
+
+    source = "%s/Group00/%s/%s_0.cpp" % (root, GetProjectName(0, 0), GetProjectName(0, 0))
+    def TouchSource():
+      with open(source, "a", encoding = "utf-8") as file:
+        file.write("// %f\n" % time.time())
+    Measure("incremental_build", lambda: build_info.BuildSolutions("Bench", need_build = True), TouchSource)
+  finally:
+    os.chdir(curdir)
+
+  try:
+    revision = subprocess.check_output(["git", "-C", os.path.dirname(os.path.abspath(__file__)), "rev-parse", "HEAD"],
+      stderr = subprocess.DEVNULL).decode().strip()
+  except (OSError, subprocess.CalledProcessError):
+    revision = ""
+  return {
+    "version" : benchmark_version,
+    "revision" : revision,
+    "parameters" : { "groups" : groups, "projects" : projects, "sources" : sources, "gens" : gens, "pch" : pch, "unity" : unity, "repeat" : repeat,
+      "build_info" : args },
+    "environment" : { "platform" : platform.platform(), "python" : platform.python_version(), "cpus" : build_info.jobs,
+      "compiler" : "%s%d" % (build_info.compiler_name, build_info.compiler_version), "project" : build_info.project_type },
+    "results" : results
+  }
+
+if __name__ == "__main__":
+  if len(sys.argv) < 2:
+    print("Usage: %s <work_dir> [groups=4] [projects=8] [sources=4] [gens=1] [pch=true] [unity=true] [repeat=3] [output=<json>] [<BuildInfo option>=<value> ...]" % sys.argv[0])
+    sys.exit(1)
+  sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+  from BuildDaemon import ParseValue
+  options = { "groups" : 4, "projects" : 8, "sources" : 4, "gens" : 1, "pch" : True, "unity" : True, "repeat" : 3 }
+  output = ""
+  build_info_args = {}
+  for arg in sys.argv[2:]:
+    key, _, value = arg.partition("=")
+    if "output" == key:
+      output = value
+    elif key in options:
+      options[key] = ParseValue(value)
+    else:
+      build_info_args[key] = ParseValue(value)
+  work_dir = os.path.abspath(sys.argv[1])
+  if not os.path.isdir(work_dir): os.makedirs(work_dir)
+  report = RunBenchmark(work_dir, build_info_args = build_info_args, **options)
+  text = json.dumps(report, indent = 1, sort_keys = True)
+  if output:
+    with open(output, "w", encoding = "utf-8") as file:
+      file.write(text + "\n")
+  print(text)
@@ -0,0 +1,92 @@
+import os, sys, json, glob
+
+# Up to date check of built solutions. Pre-push hooks and IDEs call it all
+# the time, so it stays away from BuildUtil and every toolchain probe and
+# only compares the stamps recorded by the last configure and build.
+
+def GetFileStamp(path):
+  try:
+    stat = os.stat(path)
+  except OSError:
+    return None
+  return [stat.st_size, stat.st_mtime_ns]
+
+def ReadJsonFile(path, default = None):
+  try:
+    with open(path, "r", encoding="utf-8") as file:
+      return json.load(file)
+  except (OSError, ValueError):
+    return default
+
+def ListSourceFiles(root_path, excludes):
+  files = []
+  for dir_path, dir_names, file_names in os.walk(root_path):
+    dir_names[:] = sorted([name for name in dir_names
+      if not name.startswith(".") and not os.path.abspath(os.path.join(dir_path, name)) in excludes])
+    files += [os.path.join(dir_path, name) for name in file_names]
+  return files
+
+def GetSourceStamps(root_path, excludes):
+  return dict([(os.path.relpath(path, root_path).replace("\\", "/"), GetFileStamp(path)) for path in ListSourceFiles(root_path, excludes)])
+
+def GetSolutionName(path):
+  configs = {}
+  exec(open(path).read(), configs)
+  return configs.get("name", os.path.abspath(path).replace("\\", "/").split("/")[-2])
+
+def ListSolutionPaths(solution, path = "."):
+  path = os.path.abspath(path)
+  return [cfg_path for cfg_path in ["%s/%s/solution.py" % (path, sub) for sub in solution.split("|")] if os.path.isfile(cfg_path)]
+
+def CheckBuildDirectory(build_dir):
+  if not os.path.isfile("%s/CMakeCache.txt" % build_dir): return ["not configured"]
+  reasons = []
+  configure = ReadJsonFile("%s/VeConfigure.json" % build_dir, {})
+  for path, stamp in sorted(configure.get("inputs", {}).items()):
+    if GetFileStamp(path) != stamp: reasons.append("configure input %s changed" % path)
+  build = ReadJsonFile("%s/VeBuild.json" % build_dir, None)
+  if not build: return reasons + ["no complete build recorded"]
+  stamps = GetSourceStamps(build["root_path"], build["excludes"])
+  for path in sorted(set(stamps) | set(build["sources"])):
+    if not path in build["sources"]: reasons.append("%s added" % path)
+    elif not path in stamps: reasons.append("%s removed" % path)
+    elif stamps[path] != build["sources"][path]: reasons.append("%s changed" % path)
+  for output in build.get("outputs", []):
+    if not os.path.isdir(output): reasons.append("%s missing" % output)
+  return reasons
+
+def CheckSolutions(solutions, path = ".", build_dir_name = "build", compile_info = "", quiet = False):
+  solution_paths = ListSolutionPaths(solutions, path)
+  if not solution_paths:
+    sys.stdout.write("[W] No solution found for \"%s\".\n" % solutions)
+    return 2
+  stale = False
+  for solution_path in solution_paths:
+    name = GetSolutionName(solution_path)
+    build_path = "%s/%s" % (os.path.dirname(solution_path), build_dir_name)
+    # detect_* only hold the shared toolchain checks, they are never built
+    build_dirs = sorted([os.path.dirname(path) for path in glob.glob("%s/*/VeConfigure.json" % build_path)
+      if os.path.basename(os.path.dirname(path)).startswith(compile_info) and not os.path.basename(os.path.dirname(path)).startswith(("detect_", "gen_"))])
+    if not build_dirs:
+      stale = True
+      if not quiet: sys.stdout.write("%s: not configured\n" % name)
+    for build_dir in build_dirs:
+      reasons = CheckBuildDirectory(build_dir)
+      if reasons: stale = True
+      if quiet: continue
+      if reasons:
+        more = " (+%d more)" % (len(reasons) - 5) if len(reasons) > 5 else ""
+        sys.stdout.write("%s %s: stale, %s%s\n" % (name, os.path.basename(build_dir), "; ".join(reasons[0:5]), more))
+      else:
+        sys.stdout.write("%s %s: up to date\n" % (name, os.path.basename(build_dir)))
+  return 1 if stale else 0
+
+if __name__ == "__main__":
+  if len(sys.argv) > 1:
+    options = dict([arg.partition("=")[0::2] for arg in sys.argv[2:]])
+    sys.exit(CheckSolutions(sys.argv[1], options.get("path", "."), options.get("build_dir_name", "build"), options.get("compile_info", ""),
+      options.get("quiet", "false").lower() == "true"))
+  else:
+    # "python -m BuildCheck ..." reuses the cached bytecode and starts faster than running the file
+    print("Usage: python -m BuildCheck <solutions> [path=<dir>] [build_dir_name=build] [compile_info=<prefix>] [quiet=true]")
+    sys.exit(1)
@@ -0,0 +1,288 @@
+import os, sys, json, socket, subprocess, threading, time, traceback, codecs
+
+# Requests are one JSON line. The reply is the build output followed by a
+# NUL byte and a JSON status line.
+
+build_options = ("is_venus3d", "need_gen", "need_clear", "need_build", "need_install", "additional_options", "shard", "shard_targets", "plan", "only")
+
+def GetDaemonSocket():
+  return os.environ.get("VENUS_DAEMON_SOCKET", os.path.expanduser("~/.venus_build/daemon.sock"))
+
+def Connect(socket_path = None):
+  if not hasattr(socket, "AF_UNIX"): return None
+  sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    sock.connect(socket_path or GetDaemonSocket())
+  except OSError:
+    sock.close()
+    return None
+  return sock
+
+def SendRequest(request, socket_path = None):
+  sock = Connect(socket_path)
+  if not sock: return None
+  with sock:
+    sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+    decoder = codecs.getincrementaldecoder("utf-8")("replace")
+    status = None
+    while True:
+      chunk = sock.recv(65536)
+      if not chunk: break
+      if status is None:
+        pos = chunk.find(b"\0")
+        if pos < 0:
+          sys.stdout.write(decoder.decode(chunk))
+          sys.stdout.flush()
+          continue
+        sys.stdout.write(decoder.decode(chunk[:pos], True))
+        sys.stdout.flush()
+        status = chunk[pos + 1:]
+      else:
+        status += chunk
+  if status is None: return { "exit" : 1 }
+  try:
+    return json.loads(status.decode("utf-8"))
+  except ValueError:
+    return { "exit" : 1 }
+
+def StartDaemon(socket_path = None, idle_timeout = 0, timeout = 10):
+  socket_path = socket_path or GetDaemonSocket()
+  log_dir = os.path.dirname(socket_path)
+  if not os.path.isdir(log_dir): os.makedirs(log_dir)
+  with open("%s/daemon.log" % log_dir, "a") as log_file:
+    subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve", socket_path, str(idle_timeout)],
+      stdin = subprocess.DEVNULL, stdout = log_file, stderr = subprocess.STDOUT, start_new_session = True)
+  deadline = time.time() + timeout
+  while time.time() < deadline:
+    sock = Connect(socket_path)
+    if sock:
+      sock.close()
+      return True
+    time.sleep(0.05)
+  return False
+
+def RequestBuild(solutions, env_cfgs = None, config = None, default_config = "", build_info_args = None, socket_path = None, spawn = True, **options):
+  request = {
+    "command" : "build",
+    "cwd" : os.path.abspath(os.curdir),
+    "environ" : dict(os.environ),
+    "solutions" : solutions,
+    "env_cfgs" : env_cfgs or {},
+    "build_info" : build_info_args or {},
+    "options" : options
+  }
+  if config: request["config"] = [os.path.abspath(config), default_config and os.path.abspath(default_config)]
+  status = SendRequest(request, socket_path)
+  if status is None and spawn and StartDaemon(socket_path):
+    status = SendRequest(request, socket_path)
+  if status is None: return None
+  return status.get("exit", 1)
+
+class SocketOutput:
+  def __init__(self, conn):
+    self.conn = conn
+    self.closed = False
+
+  def write(self, text):
+    if not self.closed:
+      try:
+        self.conn.sendall(text.encode("utf-8", "replace"))
+      except OSError:
+        self.closed = True
+    return len(text)
+
+  def flush(self):
+    pass
+
+class BuildDaemon:
+  def __init__(self, socket_path = None, idle_timeout = 0):
+    self.socket_path = socket_path or GetDaemonSocket()
+    self.idle_timeout = idle_timeout
+    self.build_lock = threading.Lock()
+    self.configs = {}
+    self.build_infos = {}
+    self.start_time = time.time()
+    self.last_request = self.start_time
+    self.requests = 0
+    self.running = True
+
+  def LoadConfig(self, config, default_config):
+    import BuildUtil
+    stamp = BuildUtil.GetFileStamp(config)
+    entry = self.configs.get(config)
+    if stamp and entry and entry[0] == stamp:
+      for key in entry[1]:
+        os.environ[key] = entry[1][key]
+      return dict(entry[1])
+    cfgs = BuildUtil.LoadConfig(config, default_config) or {}
+    self.configs[config] = (BuildUtil.GetFileStamp(config), cfgs)
+    return dict(cfgs)
+
+  def GetBuildInfo(self, env_cfgs, args):
+    import BuildUtil, shutil
+    key = json.dumps([os.path.abspath(os.curdir), os.environ.get("PATH", ""), env_cfgs, args], sort_keys = True)
+    entry = self.build_infos.get(key)
+    if entry and all(BuildUtil.GetFileStamp(path) == stamp for path, stamp in entry[0].items()):
+      build_info = entry[1]
+      # Drop what the last request left behind, SetConfig writes need_gen,
+      # venus3d_path and friends into env_cfgs
+      build_info.env_cfgs = dict(entry[2])
+      build_info.shard_units = None
+      build_info.shard_index = 0
+      build_info.tag_output = False
+      return build_info
+    build_info = BuildUtil.BuildInfo(dict(env_cfgs), **args)
+    watched = [shutil.which(build_info.cmake_path) or build_info.cmake_path]
+    watched += [compiler.compiler_root for compiler in build_info.compilers if compiler.compiler_root]
+    if build_info.compiler_name in ("gcc", "clang") and "win" != build_info.host_platform:
+      # compiler_root is empty for the compilers found on PATH, watch the executables
+      cxx = build_info.FindGCC() if "gcc" == build_info.compiler_name else build_info.FindClang()
+      watched += [shutil.which(name) for name in (cxx, build_info.compiler_name) if shutil.which(name)]
+    self.build_infos[key] = (dict([(path, BuildUtil.GetFileStamp(path)) for path in watched]), build_info, dict(build_info.env_cfgs))
+    return build_info
+
+  def Build(self, conn, request):
+    import BuildUtil
+    output = SocketOutput(conn)
+    stdout, stderr = sys.stdout, sys.stderr
+    curdir = os.path.abspath(os.curdir)
+    environ = dict(os.environ)
+    sys.stdout = sys.stderr = output
+    ret_code = 0
+    try:
+      os.environ.clear()
+      os.environ.update(request.get("environ", environ))
+      os.chdir(request["cwd"])
+      env_cfgs = dict(request.get("env_cfgs", {}))
+      if "config" in request:
+        env_cfgs.update(self.LoadConfig(request["config"][0], request["config"][1]))
+      build_info = self.GetBuildInfo(env_cfgs, request.get("build_info", {}))
+      build_info.BuildSolutions(request["solutions"], **request.get("options", {}))
+    except SystemExit as e:
+      ret_code = e.code if isinstance(e.code, int) else 1
+    except BuildUtil.BuildError as e:
+      BuildUtil.WriteOutput("[E] %s\n" % str(e).rstrip())
+      ret_code = 1
+    except Exception:
+      traceback.print_exc()
+      ret_code = 1
+    finally:
+      sys.stdout, sys.stderr = stdout, stderr
+      os.chdir(curdir)
+      os.environ.clear()
+      os.environ.update(environ)
+    return ret_code
+
+  def GetStatus(self):
+    import BuildUtil
+    return {
+      "pid" : os.getpid(),
+      "uptime" : time.time() - self.start_time,
+      "requests" : self.requests,
+      "busy" : self.build_lock.locked(),
+      "build_infos" : len(self.build_infos),
+      "solutions" : len(BuildUtil.solution_cache)
+    }
+
+  def Handle(self, conn):
+    with conn:
+      try:
+        data = b""
+        while not data.endswith(b"\n"):
+          chunk = conn.recv(65536)
+          if not chunk: return
+          data += chunk
+        request = json.loads(data.decode("utf-8"))
+        command = request.get("command", "")
+        status = {}
+        if "build" == command:
+          with self.build_lock:
+            self.requests += 1
+            status["exit"] = self.Build(conn, request)
+          self.last_request = time.time()
+        elif "status" == command:
+          status = self.GetStatus()
+          status["exit"] = 0
+        elif "stop" == command:
+          self.running = False
+          status["exit"] = 0
+        else:
+          conn.sendall(("Unknown request \"%s\".\n" % command).encode("utf-8"))
+          status["exit"] = 1
+        conn.sendall(b"\0" + json.dumps(status).encode("utf-8") + b"\n")
+      except (OSError, ValueError):
+        pass
+
+  def Serve(self):
+    import BuildUtil
+    if not hasattr(socket, "AF_UNIX"):
+      BuildUtil.LogError("Build daemon needs Unix domain sockets.")
+    sock = Connect(self.socket_path)
+    if sock:
+      sock.close()
+      BuildUtil.LogError("Build daemon is already listening on \"%s\"." % self.socket_path)
+    if os.path.exists(self.socket_path): os.remove(self.socket_path)
+    BuildUtil.EnsureDirectory(os.path.dirname(self.socket_path))
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Owner only from the start, a chmod after bind leaves a window
+    umask = os.umask(0o177)
+    try:
+      server.bind(self.socket_path)
+    finally:
+      os.umask(umask)
+    server.listen(8)
+    server.settimeout(1.0)
+    BuildUtil.LogInfo("Build daemon %d listening on \"%s\"." % (os.getpid(), self.socket_path))
+    try:
+      while self.running:
+        try:
+          conn, _ = server.accept()
+        except socket.timeout:
+          if self.idle_timeout > 0 and not self.build_lock.locked() and time.time() - self.last_request > self.idle_timeout:
+            break
+          continue
+        conn.settimeout(None)
+        self.last_request = time.time()
+        threading.Thread(target = self.Handle, args = (conn,), daemon = True).start()
+    finally:
+      server.close()
+      if os.path.exists(self.socket_path): os.remove(self.socket_path)
+
+def ParseValue(value):
+  if value.lower() in ("true", "false"): return "true" == value.lower()
+  try:
+    return int(value)
+  except ValueError:
+    return value
+
+if __name__ == "__main__":
+  if len(sys.argv) < 2:
+    print("Usage: %s serve [socket] [idle_seconds] | status | stop | build <solutions> [config=<file>] [<option>=<value> ...]" % sys.argv[0])
+    sys.exit(1)
+  command = sys.argv[1]
+  if "serve" == command:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    BuildDaemon(sys.argv[2] if len(sys.argv) > 2 else None, float(sys.argv[3]) if len(sys.argv) > 3 else 0).Serve()
+  elif command in ("status", "stop"):
+    status = SendRequest({ "command" : command })
+    if status is None:
+      print("Build daemon is not running.")
+      sys.exit(1)
+    if "status" == command: print(json.dumps(status, indent = 1, sort_keys = True))
+  elif "build" == command and len(sys.argv) > 2:
+    config = None
+    options = {}
+    build_info_args = {}
+    for arg in sys.argv[3:]:
+      key, _, value = arg.partition("=")
+      if "config" == key:
+        config = value
+      elif key in build_options:
+        options[key] = ParseValue(value)
+      else:
+        build_info_args[key] = ParseValue(value)
+    ret_code = RequestBuild(sys.argv[2], config = config, build_info_args = build_info_args, **options)
+    sys.exit(1 if ret_code is None else ret_code)
+  else:
+    print("Unknown command \"%s\"." % command)
+    sys.exit(1)
@@ -0,0 +1,428 @@
+import os, sys, re, json, subprocess, time, sqlite3
+
+# Compile time reports. Clang writes a -ftime-trace JSON next to every
+# object. GCC prints -ftime-report to stderr, so this module runs as the
+# compiler launcher and keeps the report in <object>.time-report.
+
+time_report_ext = ".time-report"
+
+def GetObjectPath(args):
+  for i, arg in enumerate(args):
+    if "-o" == arg and i + 1 < len(args):
+      return args[i + 1]
+    if arg.startswith("-o") and len(arg) > 2:
+      return arg[2:]
+  return None
+
+def RunTimeReportLauncher(args):
+  proc = subprocess.run(args, stderr = subprocess.PIPE)
+  report = []
+  other = []
+  in_report = False
+  for line in proc.stderr.decode("utf-8", "replace").splitlines(True):
+    if line.startswith("Time variable"): in_report = True
+    if in_report:
+      report.append(line)
+      if line.strip().startswith("TOTAL"): in_report = False
+    else:
+      other.append(line)
+  obj_path = GetObjectPath(args)
+  if report and obj_path and 0 == proc.returncode:
+    with open(obj_path + time_report_ext, "w", encoding = "utf-8") as file:
+      file.write("".join(report))
+  if "".join(other).strip():
+    sys.stderr.write("".join(other))
+  return proc.returncode
+
+def LockSlot(file):
+  try:
+    if "nt" == os.name:
+      import msvcrt
+      file.seek(0)
+      msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+    else:
+      import fcntl
+      fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    return True
+  except OSError:
+    return False
+
+def RunLinkSlotLauncher(slot_dir, slots, args):
+  # Makefiles have no job pools, a link waits for one of <slots> lock files
+  # and the lock goes away with the process
+  os.makedirs(slot_dir, exist_ok = True)
+  slot = None
+  while slot is None:
+    for i in range(max(1, slots)):
+      file = open(os.path.join(slot_dir, "slot%d.lock" % i), "a+")
+      if LockSlot(file):
+        slot = file
+        break
+      file.close()
+    else:
+      time.sleep(0.05)
+  try:
+    return subprocess.call(args)
+  finally:
+    slot.close()
+
+def AddCost(costs, name, time):
+  cost = costs.setdefault(name, [0.0, 0])
+  cost[0] += time
+  cost[1] += 1
+
+def ReadClangTrace(path):
+  try:
+    with open(path, "r", encoding = "utf-8") as file:
+      data = json.load(file)
+  except (OSError, ValueError):
+    return None
+  events = data.get("traceEvents", []) if isinstance(data, dict) else data
+  unit = { "time" : 0.0, "phases" : {}, "headers" : {}, "templates" : {} }
+  for event in events:
+    if not isinstance(event, dict) or event.get("ph") != "X": continue
+    name = event.get("name", "")
+    time = event.get("dur", 0) / 1000.0
+    detail = event.get("args", {}).get("detail", "")
+    if "ExecuteCompiler" == name:
+      unit["time"] = max(unit["time"], time)
+    elif "Source" == name:
+      AddCost(unit["headers"], detail, time)
+    elif name in ("InstantiateClass", "InstantiateFunction"):
+      AddCost(unit["templates"], detail, time)
+    elif name in ("Frontend", "Backend"):
+      unit["phases"][name] = unit["phases"].get(name, 0.0) + time
+  return unit
+
+def ReadGccReport(path):
+  try:
+    with open(path, "r", encoding = "utf-8") as file:
+      lines = file.readlines()
+  except OSError:
+    return None
+  unit = { "time" : 0.0, "phases" : {}, "headers" : {}, "templates" : {} }
+  for line in lines:
+    name, sep, values = line.partition(":")
+    times = re.findall(r"\d+\.\d+", values)
+    if not sep or len(times) < 3: continue
+    # usr, sys and wall seconds, wall is what the build waits for
+    time = float(times[2]) * 1000.0
+    name = name.strip()
+    if "TOTAL" == name:
+      unit["time"] = time
+    else:
+      unit["phases"][name] = time
+  return unit
+
+def CollectTimeTrace(build_dir, since = None):
+  # since skips traces older than the build, the units it did not recompile
+  units = []
+  for dir_path, dir_names, file_names in os.walk(build_dir):
+    dir_names[:] = [name for name in dir_names if not name.startswith(".")]
+    for file_name in file_names:
+      path = os.path.join(dir_path, file_name)
+      if file_name.endswith(time_report_ext):
+        obj_path = path[0:-len(time_report_ext)]
+        reader = ReadGccReport
+      elif file_name.endswith(".json") and (os.path.isfile(path[0:-5] + ".o") or os.path.isfile(path[0:-5] + ".obj")):
+        obj_path = path[0:-5] + (".o" if os.path.isfile(path[0:-5] + ".o") else ".obj")
+        reader = ReadClangTrace
+      else:
+        continue
+      if since is not None and os.path.getmtime(path) < since: continue
+      unit = reader(path)
+      if not unit: continue
+      obj_path = os.path.relpath(obj_path, build_dir).replace("\\", "/")
+      match = re.search(r"CMakeFiles/([^/]+)\.dir/(.+?)(\.o|\.obj)?$", obj_path)
+      unit["project"] = match.group(1) if match else ""
+      unit["file"] = match.group(2) if match else obj_path
+      units.append(unit)
+  return units
+
+def GetTopCosts(costs, top):
+  entries = sorted(costs.items(), key = lambda item: (-item[1][0], item[0]))[0:top]
+  return [{ "name" : name, "time" : round(cost[0], 1), "count" : cost[1] } for name, cost in entries]
+
+def GetTopUnits(units, top):
+  entries = sorted(units, key = lambda unit: (-unit["time"], unit["project"], unit["file"]))[0:top]
+  return [{ "project" : unit["project"], "file" : unit["file"], "time" : round(unit["time"], 1),
+    "phases" : dict([(name, round(time, 1)) for name, time in unit["phases"].items()]) } for unit in entries]
+
+def AggregateTimeTrace(units, top = 20):
+  def Aggregate(units):
+    phases = {}
+    headers = {}
+    templates = {}
+    for unit in units:
+      for name, time in unit["phases"].items():
+        AddCost(phases, name, time)
+      for key, costs in (("headers", headers), ("templates", templates)):
+        for name, cost in unit[key].items():
+          entry = costs.setdefault(name, [0.0, 0])
+          entry[0] += cost[0]
+          entry[1] += cost[1]
+    return {
+      "time" : round(sum([unit["time"] for unit in units]), 1),
+      "units" : len(units),
+      "slowest_units" : GetTopUnits(units, top),
+      "phases" : GetTopCosts(phases, top),
+      "headers" : GetTopCosts(headers, top),
+      "templates" : GetTopCosts(templates, top)
+    }
+
+  report = Aggregate(units)
+  report["projects"] = {}
+  for project in sorted(set([unit["project"] for unit in units])):
+    report["projects"][project] = Aggregate([unit for unit in units if unit["project"] == project])
+  return report
+
+def FormatTimeTrace(name, report, top = 10):
+  lines = ["Compile time report for %s: %d translation units, %.2fs in total" % (name, report["units"], report["time"] / 1000.0)]
+
+  def AddSection(title, entries, indent):
+    if not entries: return
+    lines.append("%s%s:" % (indent, title))
+    for entry in entries[0:top]:
+      if "count" in entry:
+        lines.append("%s  %10.1f ms  %6dx  %s" % (indent, entry["time"], entry["count"], entry["name"]))
+      else:
+        lines.append("%s  %10.1f ms  %s  %s" % (indent, entry["time"], entry["project"], entry["file"]))
+
+  AddSection("\nSlowest translation units", report["slowest_units"], "")
+  AddSection("\nCompiler phases (total time, translation units)", report["phases"], "")
+  AddSection("\nMost expensive headers (total inclusion time, inclusions)", report["headers"], "")
+  AddSection("\nHeaviest template instantiations (total time, instantiations)", report["templates"], "")
+  for project, entry in sorted(report["projects"].items(), key = lambda item: -item[1]["time"]):
+    lines.append("\n%s: %d translation units, %.2fs" % (project or "(unknown)", entry["units"], entry["time"] / 1000.0))
+    AddSection("Slowest translation units", entry["slowest_units"], "  ")
+    AddSection("Phases", entry["phases"], "  ")
+    AddSection("Headers", entry["headers"], "  ")
+    AddSection("Templates", entry["templates"], "  ")
+  return "\n".join(lines) + "\n"
+
+def WriteTimeTrace(build_dir, name, log_dir = None, top = 20, since = None):
+  import BuildUtil
+  # Next to the build and install logs of this build directory
+  if not log_dir: log_dir = "%s/Logs" % build_dir
+  units = CollectTimeTrace(build_dir, since)
+  if not units:
+    if since is None: BuildUtil.LogWarning("No compile time traces found in \"%s\"." % build_dir)
+    return None
+  report = AggregateTimeTrace(units, top)
+  report["name"] = name
+  BuildUtil.EnsureDirectory(log_dir)
+  base_name = "%s/time_trace_%s_%s" % (log_dir, re.sub(r"[^\w.-]+", "_", name), time.strftime("%Y_%m_%d_%H_%M_%S", time.localtime()))
+  BuildUtil.WriteJsonFile(base_name + ".json", report)
+  with open(base_name + ".txt", "w", encoding = "utf-8") as file:
+    file.write(FormatTimeTrace(name, report))
+  BuildUtil.LogInfo("Compile time report for %s written to \"%s.txt\"." % (name, base_name))
+  return report
+
+# Build history. Every Ninja build appends its .ninja_log entries to a
+# SQLite database keyed by commit, compile_info and config, Make builds
+# only record the wall time of the build step.
+
+history_schema = """
+CREATE TABLE IF NOT EXISTS runs(id INTEGER PRIMARY KEY, time REAL, solution TEXT, compile_info TEXT, config TEXT, "commit" TEXT,
+  wall REAL, busy REAL, jobs INTEGER, critical REAL);
+CREATE TABLE IF NOT EXISTS targets(run INTEGER, output TEXT, target TEXT, start INTEGER, end INTEGER);
+CREATE INDEX IF NOT EXISTS runs_key ON runs(solution, compile_info, config);
+CREATE INDEX IF NOT EXISTS targets_run ON targets(run);
+"""
+
+def GetNinjaLogMarker(build_dir):
+  try:
+    stat = os.stat("%s/.ninja_log" % build_dir)
+    return { "size" : stat.st_size, "inode" : stat.st_ino }
+  except OSError:
+    return { "size" : 0, "inode" : None }
+
+def ReadNinjaLog(build_dir, marker = None):
+  path = "%s/.ninja_log" % build_dir
+  if not os.path.isfile(path): return []
+  with open(path, "rb") as file:
+    inode = os.fstat(file.fileno()).st_ino
+    data = file.read()
+  # Ninja recompacts the log into a new file. Only trust the offset taken
+  # before the build when it is the same file, it did not shrink and the
+  # offset is on a line boundary, otherwise parse the whole log and keep
+  # the last run.
+  offset = 0
+  if marker and marker["inode"] == inode and 0 < marker["size"] <= len(data) and data[marker["size"] - 1:marker["size"]] == b"\n":
+    offset = marker["size"]
+  edges = {}
+  last_end = 0
+  for line in data[offset:].decode("utf-8", "replace").splitlines():
+    fields = line.split("\t")
+    if line.startswith("#") or len(fields) < 5: continue
+    try:
+      start, end = int(fields[0]), int(fields[1])
+    except ValueError:
+      continue
+    # Times restart from zero with every ninja run, keep the last one
+    if end < last_end: edges = {}
+    last_end = end
+    edges.setdefault((start, end, fields[4]), []).append(fields[3])
+  return [(outputs, start, end) for (start, end, _), outputs in edges.items()]
+
+def ReadNinjaGraph(build_dir, ninja = "ninja", ninja_file = None):
+  # Ninja Multi-Config keeps one build-<Config>.ninja per configuration
+  args = [ninja, "-C", build_dir] + (["-f", ninja_file] if ninja_file else []) + ["-t", "graph"]
+  try:
+    output = subprocess.check_output(args, stderr = subprocess.DEVNULL).decode("utf-8", "replace")
+  except (OSError, subprocess.CalledProcessError):
+    return None
+  labels = {}
+  rules = set()
+  links = []
+  for line in output.splitlines():
+    match = re.match(r'^"([^"]+)" \[label="((?:[^"\\]|\\.)*)"(, shape=ellipse)?', line)
+    if match:
+      labels[match.group(1)] = match.group(2)
+      if match.group(3): rules.add(match.group(1))
+      continue
+    match = re.match(r'^"([^"]+)" -> "([^"]+)"', line)
+    if match: links.append((match.group(1), match.group(2)))
+  rule_inputs = {}
+  for src, dst in links:
+    if dst in rules: rule_inputs.setdefault(dst, []).append(src)
+  inputs = {}
+  for src, dst in links:
+    if dst in rules or not dst in labels: continue
+    srcs = rule_inputs.get(src, []) if src in rules else [src]
+    inputs.setdefault(labels[dst], []).extend([labels[node] for node in srcs if node in labels])
+  return inputs
+
+def GetCriticalPath(durations, inputs):
+  best = {}
+  visiting = set()
+  for root in durations:
+    stack = [(root, False)]
+    while stack:
+      node, done = stack.pop()
+      if node in best: continue
+      deps = inputs.get(node, [])
+      if not done:
+        if node in visiting: continue
+        visiting.add(node)
+        stack.append((node, True))
+        stack += [(dep, False) for dep in deps if not dep in best]
+      else:
+        prev = max([(best[dep][0], dep) for dep in deps if dep in best] or [(0, None)])
+        best[node] = (prev[0] + durations.get(node, 0), prev[1])
+  if not best: return 0, []
+  node = max(durations, key = lambda output: (best[output][0], output))
+  length = best[node][0]
+  path = []
+  while node:
+    if durations.get(node, 0) > 0: path.append(node)
+    node = best[node][1]
+  return length, list(reversed(path))
+
+def GetTargetName(output):
+  match = re.search(r"CMakeFiles/([^/]+)\.dir/", output)
+  if match: return match.group(1)
+  return os.path.basename(output)
+
+def GetCommit(root_path):
+  try:
+    return subprocess.check_output(["git", "-C", root_path, "rev-parse", "HEAD"], stderr = subprocess.DEVNULL).decode().strip()
+  except (OSError, subprocess.CalledProcessError):
+    return ""
+
+def GetMedian(values):
+  values = sorted(values)
+  mid = len(values) // 2
+  return values[mid] if len(values) % 2 else (values[mid - 1] + values[mid]) / 2.0
+
+def RecordBuild(db_path, run, threshold = 0.25, window = 5, min_delta = 500, top = 10):
+  import BuildUtil
+  edges = ReadNinjaLog(run["build_dir"], run.get("log")) if run.get("ninja") else []
+  if run.get("ninja") and not edges: return None
+  wall = (run["end"] - run["start"]) * 1000.0
+  busy = 0.0
+  critical = 0.0
+  path = []
+  durations = {}
+  if edges:
+    wall = max([edge[2] for edge in edges]) - min([edge[1] for edge in edges])
+    busy = float(sum([edge[2] - edge[1] for edge in edges]))
+    for outputs, start, end in edges:
+      for output in outputs:
+        durations[output] = end - start
+    inputs = ReadNinjaGraph(run["build_dir"], run["ninja"], run.get("ninja_file"))
+    if inputs is not None:
+      critical, path = GetCriticalPath(durations, inputs)
+
+  BuildUtil.EnsureDirectory(os.path.dirname(os.path.abspath(db_path)))
+  db = sqlite3.connect(db_path, timeout = 60)
+  try:
+    with db:
+      db.executescript(history_schema)
+      key = (run["solution"], run["compile_info"], run["config"])
+      history = {}
+      prev_runs = [row[0] for row in db.execute("SELECT id FROM runs WHERE solution = ? AND compile_info = ? AND config = ? ORDER BY id DESC LIMIT ?",
+        key + (window * 4,))]
+      if prev_runs and durations:
+        rows = db.execute("SELECT output, end - start FROM targets WHERE run IN (%s) ORDER BY run DESC" % ",".join(["?"] * len(prev_runs)), prev_runs)
+        for output, duration in rows:
+          entry = history.setdefault(output, [])
+          if len(entry) < window: entry.append(duration)
+      cursor = db.execute('INSERT INTO runs(time, solution, compile_info, config, "commit", wall, busy, jobs, critical) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        (run["start"],) + key + (GetCommit(run["root_path"]), wall, busy, run["jobs"], critical))
+      db.executemany("INSERT INTO targets(run, output, target, start, end) VALUES (?, ?, ?, ?, ?)",
+        [(cursor.lastrowid, output, GetTargetName(output), start, end) for outputs, start, end in edges for output in outputs])
+  finally:
+    db.close()
+
+  regressions = []
+  for output, duration in durations.items():
+    if not output in history: continue
+    median = GetMedian(history[output])
+    if duration - median >= min_delta and duration > median * (1 + threshold):
+      regressions.append({ "output" : output, "time" : duration, "median" : median, "runs" : len(history[output]) })
+  regressions.sort(key = lambda entry: entry["median"] - entry["time"])
+
+  name = "%s %s-%s" % key
+  if edges:
+    parallelism = busy / wall if wall > 0 else 0
+    BuildUtil.LogInfo("%s: %d edges, %.2fs wall, %.2fs critical path, parallelism %.1f of %d jobs (%.0f%%)." %
+      (name, len(edges), wall / 1000.0, critical / 1000.0, parallelism, run["jobs"], parallelism * 100.0 / max(1, run["jobs"])))
+    targets = {}
+    for outputs, start, end in edges:
+      target = GetTargetName(outputs[0])
+      targets[target] = targets.get(target, 0) + end - start
+    lines = ["  %8.2fs  %s" % (duration / 1000.0, target) for target, duration in sorted(targets.items(), key = lambda item: -item[1])[0:top]]
+    BuildUtil.WriteOutput("Slowest targets:\n%s\n" % "\n".join(lines))
+    if path:
+      BuildUtil.WriteOutput("Critical path:\n%s\n" % "\n".join(["  %8.2fs  %s" % (durations[output] / 1000.0, output) for output in path]))
+  for entry in regressions[0:top]:
+    BuildUtil.LogWarning("%s: %s took %.2fs, median of the last %d runs is %.2fs." %
+      (name, entry["output"], entry["time"] / 1000.0, entry["runs"], entry["median"] / 1000.0))
+  return { "wall" : wall, "busy" : busy, "critical" : critical, "critical_path" : path, "regressions" : regressions }
+
+def PrintHistory(db_path, limit = 20):
+  db = sqlite3.connect(db_path, timeout = 60)
+  try:
+    rows = db.execute('SELECT time, solution, compile_info, config, "commit", wall, busy, jobs, critical FROM runs ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+  finally:
+    db.close()
+  for build_time, solution, compile_info, config, commit, wall, busy, jobs, critical in reversed(rows):
+    parallelism = busy / wall if wall > 0 else 0
+    print("%s  %-10s %s %s-%s  wall %8.2fs  critical %8.2fs  parallelism %4.1f/%d" % (time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(build_time)),
+      commit[0:10] or "-", solution, compile_info, config, wall / 1000.0, critical / 1000.0, parallelism, jobs))
+
+if __name__ == "__main__":
+  if len(sys.argv) > 2 and "time-report" == sys.argv[1]:
+    sys.exit(RunTimeReportLauncher(sys.argv[2:]))
+  elif len(sys.argv) > 4 and "link-slot" == sys.argv[1]:
+    sys.exit(RunLinkSlotLauncher(sys.argv[2], int(sys.argv[3]), sys.argv[4:]))
+  elif len(sys.argv) > 2 and "time-trace" == sys.argv[1]:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    report = WriteTimeTrace(os.path.abspath(sys.argv[2]), os.path.basename(os.path.abspath(sys.argv[2])))
+    sys.exit(0 if report else 1)
+  elif len(sys.argv) > 2 and "history" == sys.argv[1]:
+    PrintHistory(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 20)
+  else:
+    print("Usage: %s time-report <compiler> <args...> | link-slot <dir> <slots> <linker> <args...> | time-trace <build_dir> | history <db> [runs]" % sys.argv[0])
+    sys.exit(1)
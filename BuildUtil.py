@@ -1,17 +1,19 @@
 import os, sys, re, multiprocessing, subprocess, shutil, platform, time
+import concurrent.futures, json, hashlib, glob, threading, io, tempfile, copy, tarfile
+from BuildCheck import GetFileStamp, ReadJsonFile, ListSourceFiles, GetSourceStamps, CheckSolutions
 
 def GetLinuxName():
   if os.path.isfile("/etc/os-release"):
     desc = {}
-    for line in os.popen("cat /etc/os-release").read().split("\n"):
+    for line in open("/etc/os-release").read().split("\n"):
       pair = line.split("=")
       if len(pair) != 2: continue
       desc[pair[0].lower()] = pair[1].replace("\"", "").replace("'", "")
     if "id" in desc and "version_id" in desc:
       ret = "%s_%s" % (desc["id"].capitalize(), desc["version_id"].replace(".", "_"))
       return ret
-  if os.path.isfile("/etc/os-release"):
-    desc = os.popen("cat /etc/issue").read()
+  if os.path.isfile("/etc/issue"):
+    desc = open("/etc/issue").read()
     name_id = desc.split(" ")[0]
     ver = re.findall(r"\d+\.\d+", desc)
     if len(ver) > 0:
@@ -19,9 +21,15 @@ def GetLinuxName():
       return ret
   return "Linux"
 
+class BuildError(Exception):
+  pass
+
 def LogError(message):
-  print("[E] %s" % message)
-  sys.stdout.flush()
+  if threading.current_thread() is not threading.main_thread():
+    # Pipelines run on pool threads, RunTasks reports the error once on the
+    # main thread instead of exiting or pausing a worker
+    raise BuildError(message)
+  WriteOutput("[E] %s\n" % message)
   if 0 == sys.platform.find("win"):
     pause_cmd = "pause"
   else:
@@ -30,12 +38,10 @@ def LogError(message):
   sys.exit(1)
 
 def LogInfo(message):
-  print("[I] %s" % message)
-  sys.stdout.flush()
+  WriteOutput("[I] %s\n" % message)
 
 def LogWarning(message):
-  print("[W] %s" % message)
-  sys.stdout.flush()
+  WriteOutput("[W] %s\n" % message)
 
 def GetMaxVersion(path):
   dirs = os.listdir(path)
@@ -78,9 +84,49 @@ def LoadConfig(config, default_config):
     ret_config[key.upper()] = config_content[key]
   return ret_config
 
+trash_lock = threading.Lock()
+trash_pending = set()
+
+def GetTrashDirectory(dir):
+  return "%s/.venus_trash" % os.path.dirname(os.path.abspath(dir))
+
+def DeleteInBackground(path):
+  with trash_lock:
+    if path in trash_pending: return
+    trash_pending.add(path)
+  # A detached process keeps deleting after the build exits, whatever is
+  # left over is swept by the next run
+  try:
+    args = { "stdin" : subprocess.DEVNULL, "stdout" : subprocess.DEVNULL, "stderr" : subprocess.DEVNULL }
+    if 0 == sys.platform.find("win"):
+      args["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+      args["start_new_session"] = True
+    subprocess.Popen([sys.executable, "-c", "import shutil, sys; shutil.rmtree(sys.argv[1], True)", path], **args)
+  except OSError:
+    threading.Thread(target = shutil.rmtree, args = (path, True), daemon = True).start()
+
+def SweepTrash(trash_dir):
+  if not os.path.isdir(trash_dir): return
+  for name in os.listdir(trash_dir):
+    DeleteInBackground("%s/%s" % (trash_dir, name))
+
+def RecycleDirectory(dir):
+  trash_dir = GetTrashDirectory(dir)
+  target = "%s/%s.%d.%d" % (trash_dir, os.path.basename(os.path.abspath(dir)), os.getpid(), time.time_ns())
+  try:
+    if not os.path.isdir(trash_dir): os.makedirs(trash_dir, exist_ok = True)
+    os.rename(dir, target)
+  except OSError:
+    return False
+  SweepTrash(trash_dir)
+  return True
+
 def EnsureDirectory(dir, is_clean = False, is_make = True):
   if os.path.isfile(dir): os.remove(dir)
-  if is_clean and os.path.isdir(dir):
+  if is_clean and os.path.isdir(dir) and RecycleDirectory(dir):
+    if(is_make): os.makedirs(dir)
+  elif is_clean and os.path.isdir(dir):
     try:
       shutil.rmtree(dir)
       if(is_make): os.makedirs(dir)
@@ -94,11 +140,223 @@ def EnsureDirectory(dir, is_clean = False, is_make = True):
   elif not os.path.exists(dir):
     if(is_make): os.makedirs(dir)
 
+def GetAvailableMemory():
+  if os.path.isfile("/proc/meminfo"):
+    with open("/proc/meminfo") as file:
+      for line in file:
+        if line.startswith("MemAvailable:"):
+          return int(line.split()[1]) // 1024
+  elif "darwin" == sys.platform:
+    # Free and inactive pages, inactive ones are reclaimed without swapping
+    try:
+      output = subprocess.check_output(["vm_stat"]).decode()
+      page_size = int(re.search(r"page size of (\d+) bytes", output).group(1))
+      pages = dict([(match[0], int(match[1])) for match in re.findall(r"^Pages (\w+):\s+(\d+)\.", output, re.M)])
+      return (pages["free"] + pages["inactive"]) * page_size // (1024 * 1024)
+    except (OSError, subprocess.CalledProcessError, ValueError, AttributeError, KeyError):
+      pass
+  elif 0 == sys.platform.find("win"):
+    import ctypes
+    class MEMORYSTATUSEX(ctypes.Structure):
+      _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong),
+        ("ullTotalPhys", ctypes.c_ulonglong), ("ullAvailPhys", ctypes.c_ulonglong),
+        ("ullTotalPageFile", ctypes.c_ulonglong), ("ullAvailPageFile", ctypes.c_ulonglong),
+        ("ullTotalVirtual", ctypes.c_ulonglong), ("ullAvailVirtual", ctypes.c_ulonglong),
+        ("ullAvailExtendedVirtual", ctypes.c_ulonglong)]
+    status = MEMORYSTATUSEX()
+    status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+    if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+      return status.ullAvailPhys // (1024 * 1024)
+  return 0
+
 def IsFileModified(dst, src):
   if not os.path.isfile(src): LogError("\"%s\" does not exist" % src)
   if not os.path.isfile(dst): return True
   return os.stat(src).st_mtime > os.stat(dst).st_mtime
 
+file_hash_cache = {}
+file_hash_lock = threading.Lock()
+
+def GetFileHash(path):
+  stamp = GetFileStamp(path)
+  if not stamp: return ""
+  key = os.path.abspath(path)
+  with file_hash_lock:
+    entry = file_hash_cache.get(key)
+  if entry and entry[0] == stamp: return entry[1]
+  sha = hashlib.sha1()
+  with open(path, "rb") as file:
+    for chunk in iter(lambda: file.read(1 << 20), b""):
+      sha.update(chunk)
+  value = sha.hexdigest()
+  with file_hash_lock:
+    file_hash_cache[key] = (stamp, value)
+  return value
+
+def LoadFileHashes(path):
+  # Hashes of an earlier run, GetFileHash reuses them while the stamp matches
+  with file_hash_lock:
+    for key, entry in ReadJsonFile(path, {}).items():
+      if not key in file_hash_cache: file_hash_cache[key] = (entry[0], entry[1])
+
+def SaveFileHashes(path, files):
+  with file_hash_lock:
+    entries = dict([(key, file_hash_cache[key]) for key in [os.path.abspath(file) for file in files] if key in file_hash_cache])
+  WriteJsonFile(path, entries)
+
+def GetFingerprint(texts, files):
+  sha = hashlib.sha1()
+  for text in texts:
+    sha.update(text.encode("utf-8"))
+    sha.update(b"\0")
+  for path in sorted(files):
+    sha.update(("%s=%s\0" % (path, GetFileHash(path))).encode("utf-8"))
+  return sha.hexdigest()
+
+def GetStableScript(script):
+  # NEED_CLEAR/NEED_GEN only steer the Python side, they are no CMake input.
+  # Job pool sizes follow the free memory of the moment, a change alone is
+  # no reason to configure again.
+  return [re.sub(r" -DBUILD_(COMPILE|LINK)_JOBS=\d+", "", line) for line in script if not re.search(r"\bNEED_(CLEAR|GEN)=", line)]
+
+def WriteJsonFile(path, content):
+  tmp_path = "%s.%d.%d" % (path, os.getpid(), threading.get_ident())
+  with open(tmp_path, "w", encoding="utf-8") as file:
+    json.dump(content, file, indent = 1, sort_keys = True)
+  os.replace(tmp_path, path)
+
+class ProbeCache:
+  def __init__(self, path, enabled = True):
+    self.path = path
+    self.enabled = enabled
+    self.entries = {}
+    self.dirty = False
+    if self.enabled:
+      self.entries = ReadJsonFile(self.path, {})
+
+  def Locate(self, name, probe):
+    if not self.enabled: return probe()
+    key = "locate|%s|%s" % (name, os.environ.get("PATH", ""))
+    entry = self.entries.get(key)
+    if entry and entry["stamp"] and entry["stamp"] == GetFileStamp(entry["value"]):
+      return entry["value"]
+    value = probe()
+    self.entries[key] = { "stamp" : GetFileStamp(value), "value" : value }
+    self.dirty = True
+    return value
+
+  def Query(self, name, tool_path, probe):
+    if not self.enabled: return probe()
+    tool_file = shutil.which(tool_path)
+    stamp = tool_file and GetFileStamp(tool_file)
+    if not stamp: return probe()
+    key = "%s|%s" % (name, os.path.abspath(tool_file))
+    entry = self.entries.get(key)
+    if entry and entry["stamp"] == stamp:
+      return entry["value"]
+    value = probe()
+    self.entries[key] = { "stamp" : stamp, "value" : value }
+    self.dirty = True
+    return value
+
+  def Save(self):
+    if not (self.enabled and self.dirty): return
+    try:
+      EnsureDirectory(os.path.dirname(self.path))
+      WriteJsonFile(self.path, self.entries)
+      self.dirty = False
+    except OSError:
+      LogWarning("Could NOT write probe cache \"%s\"." % self.path)
+
+class ArtifactStore:
+  def Fetch(self, key, path):
+    return False
+
+  def Store(self, key, path):
+    pass
+
+class LocalArtifactStore(ArtifactStore):
+  def __init__(self, root, max_size = 10240):
+    self.root = os.path.abspath(root)
+    self.max_size = max_size * 1024 * 1024
+    self.lock = threading.Lock()
+
+  def GetPath(self, key):
+    return "%s/%s/%s.tar" % (self.root, key[0:2], key)
+
+  def Fetch(self, key, path):
+    entry = self.GetPath(key)
+    if not os.path.isfile(entry): return False
+    try:
+      os.utime(entry)
+      shutil.copyfile(entry, path)
+    except OSError:
+      return False
+    return True
+
+  def Store(self, key, path):
+    entry = self.GetPath(key)
+    try:
+      EnsureDirectory(os.path.dirname(entry))
+      tmp_path = "%s.%d.%d" % (entry, os.getpid(), threading.get_ident())
+      shutil.copyfile(path, tmp_path)
+      os.replace(tmp_path, entry)
+    except OSError:
+      LogWarning("Could NOT store artifact \"%s\"." % entry)
+      return
+    self.Trim()
+
+  def Trim(self):
+    with self.lock:
+      entries = []
+      for path in glob.glob("%s/*/*.tar" % self.root):
+        stamp = GetFileStamp(path)
+        if stamp: entries.append((stamp[1], stamp[0], path))
+      total = sum([entry[1] for entry in entries])
+      for _, size, path in sorted(entries):
+        if total <= self.max_size: break
+        try:
+          os.remove(path)
+          total -= size
+        except OSError:
+          pass
+
+class HttpArtifactStore(ArtifactStore):
+  def __init__(self, url, timeout = 60):
+    self.url = url.rstrip("/")
+    self.timeout = timeout
+
+  def Fetch(self, key, path):
+    import urllib.request, urllib.error
+    try:
+      with urllib.request.urlopen("%s/%s.tar" % (self.url, key), timeout = self.timeout) as response:
+        with open(path, "wb") as file:
+          shutil.copyfileobj(response, file)
+    except urllib.error.HTTPError as e:
+      if e.code != 404: LogWarning("Could NOT fetch artifact %s: HTTP %d." % (key, e.code))
+      return False
+    except (OSError, urllib.error.URLError) as e:
+      LogWarning("Could NOT fetch artifact %s: %s." % (key, e))
+      return False
+    return True
+
+  def Store(self, key, path):
+    import urllib.request, urllib.error
+    try:
+      with open(path, "rb") as file:
+        request = urllib.request.Request("%s/%s.tar" % (self.url, key), data = file, method = "PUT",
+          headers = { "Content-Length" : str(os.path.getsize(path)), "Content-Type" : "application/x-tar" })
+        urllib.request.urlopen(request, timeout = self.timeout).close()
+    except (OSError, urllib.error.URLError) as e:
+      LogWarning("Could NOT store artifact %s: %s." % (key, e))
+
+def GetArtifactStore(location, max_size = 10240):
+  if not location: return None
+  if not isinstance(location, str): return location
+  if location.startswith("http://") or location.startswith("https://"):
+    return HttpArtifactStore(location)
+  return LocalArtifactStore(location, max_size)
+
 class Solution:
   def __init__(self, path):
     self.configs = {}
@@ -113,6 +371,11 @@ class Solution:
   def GetName(self):
     return self.GetConfig("name", self.path.replace("\\", "/").split("/")[-2])
 
+  def GetDepends(self):
+    depends = self.GetConfig("depends", [])
+    if isinstance(depends, str): depends = [depends]
+    return depends
+
   def GetCMakeMinVer(self):
     return self.GetConfig("cmake_min_ver", "3.9")
 
@@ -123,14 +386,53 @@ class Solution:
     cmake_dir = "%s/cmake" % dir
     EnsureDirectory(cmake_dir, is_clean)
     cmake_file = os.path.abspath("%s/CMakeLists.txt" % cmake_dir)
-    if not IsFileModified(cmake_file, self.path) and not is_clean: return
-    with open(cmake_file, "w", encoding="utf-8") as file:
+    inputs_file = os.path.abspath("%s/CMakeLists.json" % cmake_dir)
+    fingerprint = GetFingerprint([], self.GetCMakeInputs())
+    if os.path.isfile(cmake_file) and ReadJsonFile(inputs_file, {}).get("fingerprint") == fingerprint: return
+    file = io.StringIO()
+    self.GenCMakeHeader(file)
+    file.write("\n")
+    self.GenCMakeStart(file)
+    file.write("\n")
+    self.GenProjects(file)
+    content = file.getvalue()
+    old_content = ""
+    if os.path.isfile(cmake_file):
+      with open(cmake_file, "r", encoding="utf-8") as old_file:
+        old_content = old_file.read()
+    generated = re.compile(r"^##  Generated:.*$", re.MULTILINE)
+    if generated.sub("", content) != generated.sub("", old_content):
       LogInfo("Generating [%s] ...\n" % cmake_file)
-      self.GenCMakeHeader(file)
-      file.write("\n")
-      self.GenCMakeStart(file)
-      file.write("\n")
-      self.GenProjects(file)
+      with open(cmake_file, "w", encoding="utf-8") as cmake_f:
+        cmake_f.write(content)
+    WriteJsonFile(inputs_file, { "fingerprint" : fingerprint })
+
+  def GenDetectCMake(self, dir):
+    detect_dir = "%s/cmake/detect" % dir
+    EnsureDirectory(detect_dir)
+    cmake_file = os.path.abspath("%s/CMakeLists.txt" % detect_dir)
+    file = io.StringIO()
+    self.GenCMakeStart(file)
+    content = file.getvalue()
+    if os.path.isfile(cmake_file):
+      with open(cmake_file, "r", encoding="utf-8") as old_file:
+        if old_file.read() == content: return cmake_file
+    with open(cmake_file, "w", encoding="utf-8") as cmake_f:
+      cmake_f.write(content)
+    return cmake_file
+
+  def GetCMakeInputs(self):
+    inputs = [self.path]
+    projects = self.GetProjects()
+    for group in projects:
+      for name in projects[group]:
+        inputs.append(self.GetProjCMake(group, name, projects[group][name]))
+    return inputs
+
+  def GetProjCMake(self, group, name, proj):
+    proj_path = "%s/%s" % (group, name)
+    if isinstance(proj, dict) and "path" in proj: proj_path = proj["path"]
+    return "%s/%s/%s.cmake" % (os.path.dirname(self.path), proj_path, name)
 
   def GenCMakeHeader(self, file):
     file.write("############################################################################\n")
@@ -178,7 +480,7 @@ class Solution:
     proj_path = "%s/%s" % (group, name)
     if "path" in proj: proj_path = proj["path"]
     proj_cmake = "%s/%s.cmake" % (proj_path, name)
-    if os.path.isfile("%s/%s" % (os.path.dirname(self.path), proj_cmake)):
+    if os.path.isfile(self.GetProjCMake(group, name, proj)):
       file.write("%sINCLUDE(../../%s)\n" % (tab, proj_cmake))
     else:
       if "type" in proj:
@@ -199,9 +501,25 @@ class Solution:
         file.write("%sADD_UNITY_VENUS3D_PLUGIN(\"%s\" \"%s\" \"../../../Include\")\n"
           % (tab, group, name))
       else: return
+      if "unity" in proj and proj["unity"]:
+        batch_size = proj["unity"]
+        if batch_size is True: batch_size = 8
+        try:
+          batch_size = int(str(batch_size))
+        except ValueError:
+          batch_size = 0
+        if batch_size < 1:
+          LogError("Invalid unity batch size %r of project %s, expecting true or a positive integer." % (proj["unity"], name))
+        file.write("%sENABLE_UNITY_BUILD(\"%s\" %d %s)\n"
+          % (tab, name, batch_size, self.GetProjList(proj, "unity_exclude")))
       if "pch" in proj and isinstance(proj["pch"], str):
         file.write("%sADD_PRECOMPILED_HEADER(\"%s\" \"%s\")\n"
           % (tab, name, proj["pch"]))
+      elif "pch" in proj and isinstance(proj["pch"], dict):
+        reuse = proj["pch"].get("reuse_from", "")
+        if proj["pch"].get("shared", False): reuse = "SHARED"
+        file.write("%sADD_PRECOMPILED_HEADER(\"%s\" \"%s\" \"%s\")\n"
+          % (tab, name, proj["pch"].get("header", ""), reuse))
       if "wd" in proj:
         file.write("%sDISABLE_WARNINGS(\"%s\" %s)\n"
           % (tab, name, self.GetProjList(proj, "wd")))
@@ -221,6 +539,39 @@ class Solution:
     ret += "\""
     return ret
 
+  def GetTargets(self):
+    ret = []
+    projects = self.GetProjects()
+    for group in projects:
+      for name in projects[group]:
+        if not self.GetGenerate(group, name, projects[group][name]): ret.append(name)
+    return ret
+
+  def ResolveTargets(self, only):
+    projects = self.GetProjects()
+    owners = {}
+    for group in projects:
+      for name in projects[group]:
+        owners.setdefault(name, group)
+    matched = set()
+    pending = []
+    for entry in only:
+      group, _, name = entry.rpartition("/")
+      if name in owners and (not group or (group in projects and name in projects[group])):
+        matched.add(entry)
+        pending.append((group or owners[name], name))
+    ret = []
+    while pending:
+      group, name = pending.pop(0)
+      if name in ret: continue
+      proj = projects[group][name]
+      if self.GetGenerate(group, name, proj): continue
+      ret.append(name)
+      libs = proj.get("libs", []) if isinstance(proj, dict) else []
+      if isinstance(libs, str): libs = [libs]
+      pending += [(owners[lib], lib) for lib in libs if lib in owners]
+    return ret, matched
+
   def GetGenerates(self):
     ret = []
     projects = self.GetProjects()
@@ -233,6 +584,7 @@ class Solution:
     return ret
 
   def GetGenerate(self, group, name, proj):
+    if isinstance(proj, str): proj = {}
     proj_path = "%s/%s" % (group, name)
     if "path" in proj: proj_path = proj["path"]
     proj_path = os.path.abspath("%s/%s" % (os.path.dirname(self.path), proj_path))
@@ -240,7 +592,20 @@ class Solution:
     option = " -DBUILD_GROUP=\"%s\"" % group
     if "version" in proj:
       option += " -D%s_VERSION=\"%s\"" % (name.upper(), proj["version"])
-    return [name, proj_path, option]
+    depends = proj.get("depends", [])
+    if isinstance(depends, str): depends = [depends]
+    return [name, proj_path, option, depends, proj.get("build", False)]
+
+solution_cache = {}
+
+def LoadSolution(path):
+  path = os.path.abspath(path)
+  stamp = GetFileStamp(path)
+  entry = solution_cache.get(path)
+  if entry and entry[0] == stamp: return entry[1]
+  solution = Solution(path)
+  solution_cache[path] = (stamp, solution)
+  return solution
 
 def ListSolutionFiles(solution, path = "."):
   res = []
@@ -250,7 +615,7 @@ def ListSolutionFiles(solution, path = "."):
     if os.path.isdir(sub_path):
       cfg_path = "%s/solution.py" % sub_path
       if os.path.exists(cfg_path):
-        res.append(Solution(cfg_path))
+        res.append(LoadSolution(cfg_path))
   return res
 
 class CompilerInfo:
@@ -265,10 +630,185 @@ class CompilerInfo:
     if build_info.host_arch != arch:
       self.is_cross_compiling = True
 
+class BuildTask:
+  def __init__(self, name, func, deps = []):
+    self.name = name
+    self.func = func
+    self.deps = list(deps)
+
+def GetTaskLevels(tasks):
+  # Dependency level of every task, tasks on one level can run side by side
+  deps = dict([(task.name, task.deps) for task in tasks])
+  levels = {}
+  def GetLevel(name, visiting = ()):
+    if not name in levels:
+      if name in visiting: return 0
+      levels[name] = 1 + max([GetLevel(dep, visiting + (name,)) for dep in deps.get(name, [])] + [0])
+    return levels[name]
+  for task in tasks:
+    GetLevel(task.name)
+  return levels
+
+def GetTaskWidths(tasks):
+  # Number of tasks on every dependency level
+  widths = {}
+  for level in GetTaskLevels(tasks).values():
+    widths[level] = widths.get(level, 0) + 1
+  return widths
+
+def RunTasks(tasks, parallel = 1):
+  names = set([task.name for task in tasks])
+  for task in tasks:
+    for dep in task.deps:
+      if not dep in names:
+        LogError("Task \"%s\" depends on unknown task \"%s\"." % (task.name, dep))
+  pending = list(tasks)
+  done = set()
+  failures = []
+  with concurrent.futures.ThreadPoolExecutor(max_workers = max(1, parallel)) as executor:
+    running = {}
+    while pending or running:
+      if not failures:
+        for task in [task for task in pending if all(dep in done for dep in task.deps)]:
+          pending.remove(task)
+          running[executor.submit(task.func)] = task
+      if not running:
+        if failures: break
+        LogError("Circular dependency between tasks: %s" % ", ".join([task.name for task in pending]))
+      finished, _ = concurrent.futures.wait(running, return_when = concurrent.futures.FIRST_COMPLETED)
+      for future in finished:
+        task = running.pop(future)
+        try:
+          future.result()
+          done.add(task.name)
+        except BuildError as e:
+          # Let the running tasks finish, start nothing new
+          failures.append("%s: %s" % (task.name, str(e).rstrip()))
+  if failures:
+    LogError("\n".join(failures))
+
+output_lock = threading.Lock()
+output_context = threading.local()
+
+def WriteOutput(text):
+  prefix = getattr(output_context, "prefix", "")
+  if prefix:
+    text = "".join([prefix + line for line in text.splitlines(True)])
+  with output_lock:
+    sys.stdout.write(text)
+    sys.stdout.flush()
+
+class BuildTrace:
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.Reset()
+
+  def Reset(self):
+    with self.lock:
+      self.events = []
+      self.origin = time.time()
+
+  def Add(self, task_name, start, end, ret_code, retries, commands):
+    event = {
+      "name" : task_name,
+      "phase" : task_name.split(" ")[0],
+      "pipeline" : getattr(output_context, "pipeline", ""),
+      "start" : start,
+      "end" : end,
+      "exit_code" : ret_code,
+      "retries" : retries,
+      "commands" : commands
+    }
+    with self.lock:
+      self.events.append(event)
+
+  def WriteChromeTrace(self, path):
+    with self.lock:
+      events = list(self.events)
+    tids = {}
+    trace_events = []
+    for event in events:
+      lane = event["pipeline"] or "main"
+      if not lane in tids:
+        tids[lane] = len(tids) + 1
+        trace_events.append({ "name" : "thread_name", "ph" : "M", "pid" : 1, "tid" : tids[lane], "args" : { "name" : lane } })
+      trace_events.append({
+        "name" : event["name"],
+        "cat" : event["phase"],
+        "ph" : "X",
+        "pid" : 1,
+        "tid" : tids[lane],
+        "ts" : int((event["start"] - self.origin) * 1000000),
+        "dur" : int((event["end"] - event["start"]) * 1000000),
+        "args" : { "exit_code" : event["exit_code"], "retries" : event["retries"], "commands" : event["commands"] }
+      })
+    EnsureDirectory(os.path.dirname(os.path.abspath(path)))
+    WriteJsonFile(path, { "traceEvents" : trace_events, "displayTimeUnit" : "ms" })
+
+  def PrintSummary(self):
+    with self.lock:
+      events = list(self.events)
+    if not events: return
+    rows = []
+    totals = {}
+    for event in events:
+      duration = event["end"] - event["start"]
+      totals[event["phase"]] = totals.get(event["phase"], 0) + duration
+      exit_code = event["exit_code"]
+      if exit_code is None: exit_code = "skipped"
+      rows.append(("%s: %s" % (event["pipeline"], event["name"]) if event["pipeline"] else event["name"],
+        duration, "exit %s, retries %d" % (exit_code, event["retries"])))
+    for phase in sorted(totals):
+      rows.append(("Total %s" % phase, totals[phase], ""))
+    rows.append(("Wall clock", time.time() - self.origin, ""))
+    width = max([len(row[0]) for row in rows])
+    lines = ["Build summary:"]
+    for row in rows:
+      lines.append(("\t%-*s %9.2fs  %s" % (width, row[0], row[1], row[2])).rstrip())
+    WriteOutput("\n".join(lines) + "\n\n")
+
+build_trace = BuildTrace()
+
+class BuildPipeline:
+  def __init__(self, name):
+    self.name = name
+    self.steps = []
+    self.tag_output = False
+
+  def AddCall(self, func, *args):
+    self.steps.append((func, args))
+
+  def AddBatch(self, batch_cmd, repeat, log_name):
+    self.steps.append((batch_cmd.ExecuteEx, (repeat, log_name, "Logs")))
+
+  def GetCommands(self):
+    commands = []
+    for func, args in self.steps:
+      batch_cmd = getattr(func, "__self__", None)
+      if not isinstance(batch_cmd, BatchCommand):
+        batch_cmd = next((arg for arg in args if isinstance(arg, BatchCommand)), None)
+      if batch_cmd:
+        commands.append({ "name" : batch_cmd.task_name_, "work_dir" : batch_cmd.work_dir_, "script" : batch_cmd.GetScript() })
+    return commands
+
+  def Run(self):
+    if self.tag_output:
+      output_context.prefix = "[%s] " % self.name
+    output_context.pipeline = self.name
+    try:
+      for func, args in self.steps:
+        func(*args)
+    finally:
+      output_context.prefix = ""
+      output_context.pipeline = ""
+    sys.stdout.flush()
+
 class BatchCommand:
-  def __init__(self, task_name, environ = None):
+  def __init__(self, task_name, environ = None, work_dir = None):
     self.task_name_ = task_name
     self.commands_ = []
+    self.environ_ = {}
+    self.work_dir_ = work_dir
     host_platform = sys.platform
     if 0 == host_platform.find("win"):
       host_platform = "win"
@@ -296,51 +836,82 @@ class BatchCommand:
 
   def AddEnviron(self, environ):
     for key in environ:
+      self.environ_[key] = str(environ[key])
+
+  def GetScript(self):
+    lines = []
+    for key in sorted(self.environ_):
       if "win" == self.host_platform_:
-        self.AddCommand("@SET %s=%s" % (key, environ[key]))
+        lines.append("@SET %s=%s" % (key, self.environ_[key]))
       else:
-        self.AddCommand("export %s=%s" % (key, environ[key]))
+        lines.append("export %s=%s" % (key, self.environ_[key]))
+    return lines + self.commands_
 
-  def Execute(self):
-    batch_file = "ve_build."
+  def Execute(self, log_file = None):
+    env = dict(os.environ)
+    env.update(self.environ_)
+    batch_file = None
     if "win" == self.host_platform_:
-      batch_file += "bat"
+      fd, batch_file = tempfile.mkstemp(".bat", "ve_build_", self.work_dir_)
+      with os.fdopen(fd, "w") as batch_f:
+        batch_f.writelines([cmd_line + "\n" for cmd_line in self.commands_])
+      args = ["cmd", "/d", "/c", batch_file]
     else:
-      batch_file += "sh"
-    batch_f = open(batch_file, "w")
-    batch_f.writelines([cmd_line + "\n" for cmd_line in self.commands_])
-    batch_f.close()
-    if "win" == self.host_platform_:
-      ret_code = subprocess.call(batch_file, shell = True)
-    else:
-      subprocess.call("chmod 777 " + batch_file, shell = True)
-      ret_code = subprocess.call("./" + batch_file, shell = True)
-    os.remove(batch_file)
+      args = ["/bin/sh", "-c", "\n".join(self.commands_)]
+    try:
+      process = subprocess.Popen(args, cwd = self.work_dir_, env = env,
+        stdout = subprocess.PIPE, stderr = subprocess.STDOUT)
+      for line in iter(process.stdout.readline, b""):
+        text = line.decode("utf-8", "replace")
+        WriteOutput(text)
+        if log_file: log_file.write(text)
+      process.stdout.close()
+      ret_code = process.wait()
+    finally:
+      if batch_file: os.remove(batch_file)
     return ret_code
 
   def ExecuteEx(self, repeat = 0, log_name = "", log_dir = ""):
+    log_file = None
     if log_name and len(log_name) > 0:
       log_name = "%s_%s.txt" % (log_name, time.strftime("%Y_%m_%d_%H_%M_%S", time.localtime()))
       if log_dir and len(log_dir) > 0:
+        if self.work_dir_ and not os.path.isabs(log_dir):
+          log_dir = os.path.join(self.work_dir_, log_dir)
         EnsureDirectory(log_dir)
         log_name = "%s/%s" % (log_dir, log_name)
-      with open(log_name, "w", encoding="utf-8") as file:
-        file.writelines([cmd_line + "\n" for cmd_line in self.commands_])
-    i = 1
-    if self.task_name_ and len(self.task_name_) > 0:
-      LogInfo("%s ...\n" % self.task_name_)
-    while self.Execute() !=0:
-      if i < repeat:
-        LogWarning("%s failed, retry %d ...\n" % (self.task_name_, i))
-        i += 1
-      else:
-        LogError("%s failed.\n" % self.task_name_)
-    print("")
+      log_file = open(log_name, "w", encoding="utf-8")
+      log_file.writelines([cmd_line + "\n" for cmd_line in self.GetScript()])
+      log_file.write("\n")
+    start = time.time()
+    try:
+      i = 1
+      if self.task_name_ and len(self.task_name_) > 0:
+        LogInfo("%s ...\n" % self.task_name_)
+      while True:
+        ret_code = self.Execute(log_file)
+        if ret_code == 0: break
+        if i < repeat:
+          LogWarning("%s failed, retry %d ...\n" % (self.task_name_, i))
+          if log_file: log_file.write("\n[W] Retry %d\n\n" % i)
+          i += 1
+        else:
+          build_trace.Add(self.task_name_, start, time.time(), ret_code, i - 1, self.commands_)
+          LogError("%s failed.\n" % self.task_name_)
+    finally:
+      if log_file: log_file.close()
+    build_trace.Add(self.task_name_, start, time.time(), 0, i - 1, self.commands_)
+    WriteOutput("\n")
     LogInfo("%s succeeded.\n" % self.task_name_)
 
 class BuildInfo:
-  def __init__(self, env_cfgs, target = "auto", project = "auto", compiler = "auto", archs = "auto", configs = "auto", cmake_path = "auto", prefer_shared = True):
+  def __init__(self, env_cfgs, target = "auto", project = "auto", compiler = "auto", archs = "auto", configs = "auto", cmake_path = "auto", prefer_shared = True, parallel = 1, use_probe_cache = True, compiler_launcher = "", linker = "", split_debug = None, compile_job_memory = 1024, link_job_memory = 4096,
+    artifact_cache = "", artifact_cache_size = 10240, time_trace = False, build_history = "build_history.db", regression_threshold = 0.25,
+    seed_toolchain = True):
     self.env_cfgs = env_cfgs
+    if "VENUS_NO_PROBE_CACHE" in os.environ:
+      use_probe_cache = False
+    self.probe_cache = ProbeCache(os.environ.get("VENUS_PROBE_CACHE", os.path.expanduser("~/.venus_build/probe_cache.json")), use_probe_cache)
     env = os.environ
     host_platform = sys.platform
     if 0 == host_platform.find("win"):
@@ -685,9 +1256,16 @@ class BuildInfo:
           compilers.append(CompilerInfo(self, arch, gen_name, compiler_root))
       else:
         LogError("Wrong combination of project %s and compiler %s.\n" % (project_type, compiler))
-    elif "make" == project_type or "ninja" == project_type:
+    elif "make" == project_type or "ninja" == project_type or "ninja_multi" == project_type:
       if "ninja" == project_type:
         gen_name = "Ninja"
+      elif "ninja_multi" == project_type:
+        if self.cmake_ver < 317:
+          LogError("Ninja Multi-Config needs CMake 3.17 or newer.\n")
+        if "android" == target_platform or "ios" == target_platform:
+          LogError("Wrong combination of project %s and target platform %s.\n" % (project_type, target_platform))
+        gen_name = "Ninja Multi-Config"
+        multi_config = True
       else:
         if "win" == host_platform:
           gen_name = "MinGW Makefiles"
@@ -742,10 +1320,65 @@ class BuildInfo:
     self.cfg = cfg
 
     self.jobs = multiprocessing.cpu_count()
-
+    if "auto" == parallel or 0 == parallel:
+      parallel = self.jobs
+    self.parallel = max(1, int(parallel))
+    self.available_memory = GetAvailableMemory()
+    self.compile_job_memory = compile_job_memory
+    self.link_job_memory = link_job_memory
+    self.compile_jobs = self.GetJobCount(compile_job_memory, self.jobs)
+    self.link_jobs = self.GetJobCount(link_job_memory, self.compile_jobs)
+    self.tag_output = False
+    self.shard_units = None
+    self.shard_index = 0
+    self.only_targets = None
+
+    self.compiler_launcher = ""
+    if "auto" == compiler_launcher:
+      for name in ("sccache", "ccache"):
+        if shutil.which(name):
+          compiler_launcher = name
+          break
+      else:
+        compiler_launcher = ""
+    if len(compiler_launcher) > 0:
+      launcher_path = shutil.which(compiler_launcher)
+      if not launcher_path:
+        LogError("Could NOT find compiler launcher \"%s\"." % compiler_launcher)
+      self.compiler_launcher = launcher_path
+      if "sccache" in os.path.basename(launcher_path).lower():
+        self.compiler_launcher_type = "sccache"
+        cache_dir_key, cache_size_key = "SCCACHE_DIR", "SCCACHE_CACHE_SIZE"
+      else:
+        self.compiler_launcher_type = "ccache"
+        cache_dir_key, cache_size_key = "CCACHE_DIR", "CCACHE_MAXSIZE"
+      if "COMPILER_CACHE_DIR" in self.env_cfgs:
+        self.SetConfig(cache_dir_key, os.path.abspath(self.env_cfgs["COMPILER_CACHE_DIR"]))
+      if "COMPILER_CACHE_SIZE" in self.env_cfgs:
+        self.SetConfig(cache_size_key, self.env_cfgs["COMPILER_CACHE_SIZE"])
+
+    self.linker = linker
+    self.split_debug = split_debug
+    self.time_trace = time_trace
+    self.build_history = build_history
+    self.seed_toolchain = seed_toolchain
+    self.regression_threshold = regression_threshold
+    if self.time_trace and "vc" == self.compiler_name:
+      LogWarning("Time trace is not supported by Visual C++, ignored.")
+      self.time_trace = False
+
+    if not artifact_cache: artifact_cache = os.environ.get("VENUS_ARTIFACT_CACHE", "")
+    self.artifact_store = GetArtifactStore(artifact_cache, artifact_cache_size)
+
+    self.probe_cache.Save()
     self.DisplayInfo()
 
-  def MSBuildAddBuildCommand(self, batch_cmd, sln_name, proj_name, config, arch = ""):
+  def GetJobCount(self, job_memory, limit):
+    if self.available_memory <= 0 or job_memory <= 0: return limit
+    return max(1, min(limit, self.available_memory // job_memory))
+
+  def MSBuildAddBuildCommand(self, batch_cmd, sln_name, proj_name, config, arch = "", jobs = 0):
+    if jobs <= 0: jobs = self.compile_jobs
     batch_cmd.AddCommand('@SET VisualStudioVersion=%d.0' % self.vs_version)
     if len(proj_name) != 0:
       file_name = "%s.%s" % (proj_name, self.proj_ext_name)
@@ -754,15 +1387,17 @@ class BuildInfo:
     config_str = "Configuration=%s" % config
     if len(arch) != 0:
       config_str = "%s,Platform=%s" % (config_str, arch)
-    batch_cmd.AddCommand('@MSBuild %s /nologo /m:%d /v:m /p:%s' % (file_name, self.jobs, config_str))
+    batch_cmd.AddCommand('@MSBuild %s /nologo /m:%d /v:m /p:%s' % (file_name, jobs, config_str))
     batch_cmd.AddCommand('@if ERRORLEVEL 1 exit /B 1')
 
-  def XCodeBuildAddBuildCommand(self, batch_cmd, target_name, config):
-    batch_cmd.AddCommand('xcodebuild -target %s -jobs %d -configuration %s | xcpretty' % (target_name, self.jobs, config))
+  def XCodeBuildAddBuildCommand(self, batch_cmd, target_name, config, jobs = 0):
+    if jobs <= 0: jobs = self.compile_jobs
+    batch_cmd.AddCommand('xcodebuild -target %s -jobs %d -configuration %s | xcpretty' % (target_name, jobs, config))
     batch_cmd.AddCommand('if (($? != 0)); then exit 1; fi')
 
-  def MakeAddBuildCommand(self, batch_cmd, make_name, target):
-    make_options = "-j%d" % self.jobs
+  def MakeAddBuildCommand(self, batch_cmd, make_name, target, jobs = 0):
+    if jobs <= 0: jobs = self.compile_jobs
+    make_options = "-j%d" % jobs
     if target != "ALL_BUILD":
       make_options += " %s" % target
     if "win" == self.host_platform:
@@ -806,13 +1441,14 @@ class BuildInfo:
         if len(gcc_loc) != 0:
           return gcc_loc.split(self.sep)[0]
 
-    gcc_loc = subprocess.check_output(self.where_cmd + " g++", shell = True).decode()
+    gcc_loc = self.probe_cache.Locate("g++", lambda: subprocess.check_output(self.where_cmd + " g++", shell = True).decode().split(self.sep)[0])
     if len(gcc_loc) == 0:
       LogError("Could NOT find g++. Please install g++ 7.1+, set its path into CXX, or put its path into %%PATH%%.")
-    return gcc_loc.split(self.sep)[0]
+    return gcc_loc
 
   def RetrieveGCCVersion(self):
-    gcc_ver = subprocess.check_output([self.FindGCC(), "-dumpfullversion"]).decode()
+    gcc_path = self.FindGCC()
+    gcc_ver = self.probe_cache.Query("dumpfullversion", gcc_path, lambda: subprocess.check_output([gcc_path, "-dumpfullversion"]).decode())
     gcc_ver_components = gcc_ver.split(".")
     return int(gcc_ver_components[0] + gcc_ver_components[1])
 
@@ -824,10 +1460,10 @@ class BuildInfo:
         if len(clang_loc) != 0:
           return clang_loc.split(self.sep)[0]
 
-    clang_loc = subprocess.check_output(self.where_cmd + " clang++", shell = True).decode()
+    clang_loc = self.probe_cache.Locate("clang++", lambda: subprocess.check_output(self.where_cmd + " clang++", shell = True).decode().split(self.sep)[0])
     if len(clang_loc) == 0:
       LogError("Could NOT find g++. Please install clang++ 3.6+, set its path into CXX, or put its path into %%PATH%%.")
-    return clang_loc.split(self.sep)[0]
+    return clang_loc
 
   def RetrieveClangVersion(self, path = ""):
     if ("android" == self.target_platform):
@@ -838,7 +1474,7 @@ class BuildInfo:
       clang_path = prebuilt_clang_path + self.slash + "clang"
     else:
       clang_path = path + "clang"
-    clang_ver = subprocess.check_output([clang_path, "--version"]).decode()
+    clang_ver = self.probe_cache.Query("version", clang_path, lambda: subprocess.check_output([clang_path, "--version"]).decode())
     clang_ver_tokens = clang_ver.split()
     for i in range(0, len(clang_ver_tokens)):
       if "version" == clang_ver_tokens[i]:
@@ -882,13 +1518,13 @@ class BuildInfo:
   def FindVS2017PlusFolder(self, program_files_folder, vs_version, vs_name):
     try_vswhere_location = program_files_folder + "\\Microsoft Visual Studio\\Installer\\vswhere.exe"
     if os.path.exists(try_vswhere_location):
-      vs_location = subprocess.check_output([try_vswhere_location,
+      vs_location = self.probe_cache.Query("vswhere_%d" % vs_version, try_vswhere_location, lambda: subprocess.check_output([try_vswhere_location,
         "-products", "*",
         "-latest",
         "-requires", "Microsoft.VisualStudio.Component.VC.Tools.x86.x64",
         "-property", "installationPath",
         "-version", "[%d.0,%d.0)" % (vs_version, vs_version + 1),
-        "-prerelease"]).decode().split("\r\n")[0]
+        "-prerelease"]).decode()).split("\r\n")[0]
       try_folder = vs_location + "\\VC\\Auxiliary\\Build\\"
       try_vcvarsall = "VCVARSALL.BAT"
       if os.path.exists(try_folder + try_vcvarsall):
@@ -912,13 +1548,13 @@ class BuildInfo:
         LogError("Could NOT find CMake from \"%s\"" % cmake_path)
       cmake_path = "%s/%s/bin/cmake" % (cmake_path, ver_dir)
       return cmake_path
-    cmake_loc = subprocess.check_output(self.where_cmd + " cmake", shell = True).decode()
+    cmake_loc = self.probe_cache.Locate("cmake", lambda: subprocess.check_output(self.where_cmd + " cmake", shell = True).decode().split(self.sep)[0])
     if len(cmake_loc) == 0:
       LogError("Could NOT find CMake. Please install CMake 3.6+, set its path into CfgBuild's self.cmake_path, or put its path into %%PATH%%.")
-    return cmake_loc.split(self.sep)[0]
+    return cmake_loc
 
   def RetrieveCMakeVersion(self):
-    cmake_ver = subprocess.check_output([self.cmake_path, "--version"]).decode()
+    cmake_ver = self.probe_cache.Query("version", self.cmake_path, lambda: subprocess.check_output([self.cmake_path, "--version"]).decode())
     if len(cmake_ver) == 0:
       LogError("Could NOT find CMake. Please install CMake 3.6+, set its path into CfgBuild's self.cmake_path, or put its path into %%PATH%%.")
     cmake_ver = cmake_ver.split()[2]
@@ -934,6 +1570,18 @@ class BuildInfo:
     if self.is_android:
       print("\tTarget API level: %d" % self.target_api_level)
     print("\tCPU count: %d" % self.jobs)
+    print("\tParallel pipelines: %d" % self.parallel)
+    if self.available_memory > 0:
+      print("\tAvailable memory: %d MB" % self.available_memory)
+    print("\tCompile jobs: %d, link jobs: %d" % (self.compile_jobs, self.link_jobs))
+    if self.compiler_launcher:
+      print("\tCompiler launcher: %s" % self.compiler_launcher)
+    if self.linker:
+      print("\tLinker: %s" % self.linker)
+    if self.time_trace:
+      print("\tTime trace: %s" % self.time_trace)
+    if self.artifact_store:
+      print("\tArtifact cache: %s" % getattr(self.artifact_store, "root", getattr(self.artifact_store, "url", type(self.artifact_store).__name__)))
     print("\tUse shared library: %s" % self.lib_shared)
     print("\tProject type: %s" % self.project_type)
     print("\tCompiler: %s%d" % (self.compiler_name, self.compiler_version))
@@ -966,11 +1614,346 @@ class BuildInfo:
       return default
     return self.env_cfgs[key]
 
-  def BuildSolutions(self, solutions, is_venus3d = False, need_gen = False, need_clear = False, need_build = False, need_install = False, additional_options = ""):
-    for solution in ListSolutionFiles(solutions):
-      self.BuildSolution(solution, is_venus3d, need_gen, need_clear, need_build, need_install, additional_options)
+  def GetConfigureInputs(self, solution, build_path, options):
+    venus_build_path = self.GetConfig("venus_build_path")
+    inputs = [solution.path, os.path.abspath("%s/cmake/CMakeLists.txt" % build_path), self.cmake_path]
+    inputs += [path for path in glob.glob("%s/cmake/*" % venus_build_path) if os.path.isfile(path)]
+    for toolchain in re.findall(r"-DCMAKE_TOOLCHAIN_FILE=\"([^\"]+)\"", options):
+      inputs.append(toolchain)
+    return [os.path.abspath(path) for path in inputs]
+
+  def Configure(self, cmake_cmd, log_name, build_dir, inputs):
+    fingerprint_file = "%s/VeConfigure.json" % build_dir
+    fingerprint = GetFingerprint(GetStableScript(cmake_cmd.GetScript()) + ["%s%d" % (self.compiler_name, self.compiler_version)], inputs)
+    stored = ReadJsonFile(fingerprint_file, {})
+    if os.path.isfile("%s/CMakeCache.txt" % build_dir) and stored.get("fingerprint") == fingerprint:
+      LogInfo("%s skipped, configure inputs unchanged.\n" % cmake_cmd.task_name_)
+      now = time.time()
+      build_trace.Add(cmake_cmd.task_name_, now, now, None, 0, [])
+      return
+    if os.path.isfile(fingerprint_file): os.remove(fingerprint_file)
+    cmake_cmd.ExecuteEx(0, log_name, "Logs")
+    WriteJsonFile(fingerprint_file, { "fingerprint" : fingerprint, "inputs" : dict([(path, GetFileStamp(path)) for path in inputs]) })
+
+  def AddGenerateTasks(self, tasks, solution, build_path, compile_info, env_cfgs, cmake_options, config, need_clear, seed_dir = None):
+    for generate in solution.GetGenerates():
+      gen_dir = os.path.abspath("%s/gen_%s/%s" % (build_path,  compile_info, generate[0]))
+      gen_pipeline = BuildPipeline("Generate %s %s" % (compile_info, generate[0]))
+      gen_pipeline.tag_output = self.tag_output or self.parallel > 1
+      gen_pipeline.AddCall(EnsureDirectory, gen_dir, need_clear)
+      if seed_dir: gen_pipeline.AddCall(self.SeedBuildDirectory, seed_dir, gen_dir)
+      gen_cmd = BatchCommand("Generate %s" % generate[0], env_cfgs, gen_dir)
+      gen_cmd.AddCommand("\"%s\" %s %s \"%s\"" % (self.cmake_path, cmake_options, generate[2], generate[1]))
+      gen_pipeline.AddBatch(gen_cmd, 0, "gen_%s" % generate[0])
+      if generate[4]:
+        gen_build_cmd = BatchCommand("Build %s" % generate[0], env_cfgs, gen_dir)
+        gen_build_cmd.AddCommand("\"%s\" --build . --config %s" % (self.cmake_path, config))
+        gen_pipeline.AddBatch(gen_build_cmd, 0, "gen_build_%s" % generate[0])
+      deps = ["Generate %s %s" % (compile_info, dep) for dep in generate[3]]
+      tasks.append(BuildTask(gen_pipeline.name, gen_pipeline.Run, deps))
+
+  def AddDetectTask(self, tasks, solution, build_path, compile_info, env_cfgs, generator, options, need_clear):
+    detect_dir = os.path.abspath("%s/detect_%s" % (build_path, compile_info))
+    detect_cmake = os.path.abspath("%s/cmake/detect/CMakeLists.txt" % build_path)
+    pipeline = BuildPipeline("Detect %s" % compile_info)
+    pipeline.tag_output = self.tag_output or self.parallel > 1
+    pipeline.AddCall(EnsureDirectory, detect_dir, need_clear)
+    detect_cmd = BatchCommand("Detect %s" % compile_info, env_cfgs, detect_dir)
+    detect_cmd.AddCommand("\"%s\" -G \"%s\" %s ../cmake/detect" % (self.cmake_path, generator, options))
+    inputs = [path for path in self.GetConfigureInputs(solution, build_path, options)
+      if not path in (solution.path, os.path.abspath("%s/cmake/CMakeLists.txt" % build_path))]
+    pipeline.AddCall(self.Configure, detect_cmd, "detect_%s" % compile_info, detect_dir, inputs + [detect_cmake])
+    pipeline.AddCall(self.WriteToolchainSeed, detect_dir)
+    tasks.append(BuildTask(pipeline.name, pipeline.Run))
+    return detect_dir
+
+  def WriteToolchainSeed(self, detect_dir):
+    # Compiler checks only depend on the toolchain and arch, hand their
+    # results to every build dir configured with the same compile_info.
+    # Without CMAKE_PLATFORM_INFO_INITIALIZED CMake discards the copied
+    # platform files of a fresh build dir.
+    lines = []
+    comment = ""
+    with open("%s/CMakeCache.txt" % detect_dir, "r", encoding="utf-8") as file:
+      for line in file:
+        line = line.rstrip("\r\n")
+        if line.startswith("//"):
+          comment = line[2:]
+          continue
+        match = re.match(r"^([A-Za-z_][^:]*):([A-Z]+)=(.*)$", line)
+        if match:
+          name, type, value = match.groups()
+          if ("INTERNAL" == type and not name.endswith("-ADVANCED") and not re.match(r"^CMAKE_(CACHE|GENERATOR)", name)
+            and not name in ("CMAKE_COMMAND", "CMAKE_CPACK_COMMAND", "CMAKE_CTEST_COMMAND", "CMAKE_EDIT_COMMAND", "CMAKE_EXTRA_GENERATOR",
+              "CMAKE_HOME_DIRECTORY", "CMAKE_NUMBER_OF_MAKEFILES", "CMAKE_ROOT")) or name in ("CMAKE_C_COMPILER", "CMAKE_CXX_COMPILER"):
+            value = value.replace("\\", "\\\\").replace("\"", "\\\"").replace("$", "\\$")
+            lines.append("SET(%s \"%s\" CACHE %s \"%s\")" % (name, value, type, comment.replace("\"", "'")))
+        comment = ""
+    seed_file = "%s/VeSeed.cmake" % detect_dir
+    content = "\n".join(lines) + "\n"
+    if not os.path.isfile(seed_file) or open(seed_file, "r", encoding="utf-8").read() != content:
+      with open(seed_file, "w", encoding="utf-8") as file:
+        file.write(content)
+
+  def SeedBuildDirectory(self, detect_dir, build_dir):
+    if os.path.isfile("%s/CMakeCache.txt" % build_dir): return
+    for path in glob.glob("%s/CMakeFiles/*/CMake*Compiler.cmake" % detect_dir) + glob.glob("%s/CMakeFiles/*/CMakeSystem.cmake" % detect_dir):
+      target = os.path.join(build_dir, os.path.relpath(path, detect_dir))
+      EnsureDirectory(os.path.dirname(target))
+      shutil.copyfile(path, target)
+
+  def GetCompilerCacheStats(self):
+    if not self.compiler_launcher: return None
+    env = dict(os.environ)
+    env.update(self.env_cfgs)
+    try:
+      if "sccache" == self.compiler_launcher_type:
+        stats = json.loads(subprocess.check_output([self.compiler_launcher, "--show-stats", "--stats-format=json"], env = env).decode())["stats"]
+        hits = sum(stats.get("cache_hits", {}).get("counts", {}).values())
+        misses = sum(stats.get("cache_misses", {}).get("counts", {}).values())
+        return (hits, misses)
+      try:
+        output = subprocess.check_output([self.compiler_launcher, "--print-stats"], env = env, stderr = subprocess.DEVNULL).decode()
+        stats = dict([line.split("\t", 1) for line in output.splitlines() if "\t" in line])
+        hits = int(stats.get("direct_cache_hit", 0)) + int(stats.get("preprocessed_cache_hit", 0))
+        return (hits, int(stats.get("cache_miss", 0)))
+      except subprocess.CalledProcessError:
+        output = subprocess.check_output([self.compiler_launcher, "-s"], env = env).decode()
+        hits = sum([int(n) for n in re.findall(r"cache hit \(\w+\)\s+(\d+)", output)])
+        misses = sum([int(n) for n in re.findall(r"cache miss\s+(\d+)", output)])
+        return (hits, misses)
+    except (OSError, ValueError, KeyError, subprocess.CalledProcessError):
+      LogWarning("Could NOT read statistics from \"%s\"." % self.compiler_launcher)
+      return None
+
+  def PrintCompilerCacheStats(self, before):
+    after = self.GetCompilerCacheStats()
+    if not (before and after): return
+    hits = after[0] - before[0]
+    misses = after[1] - before[1]
+    total = hits + misses
+    rate = 0
+    if total > 0: rate = hits * 100.0 / total
+    WriteOutput("Compiler cache (%s): %d hits, %d misses, %.1f%% hit rate\n\n" % (self.compiler_launcher_type, hits, misses, rate))
+
+  def BuildSolutions(self, solutions, is_venus3d = False, need_gen = False, need_clear = False, need_build = False, need_install = False, additional_options = "",
+    shard = "", shard_targets = False, plan = "", only = ""):
+    solution_list = ListSolutionFiles(solutions)
+    # The daemon and the benchmark reuse one BuildInfo, start every call unsharded
+    self.only_targets = None
+    self.shard_units = None
+    self.shard_index = 0
+    if only:
+      if isinstance(only, str): only = [entry.strip() for entry in only.split(",") if entry.strip()]
+      self.only_targets = {}
+      matched = set()
+      for solution in solution_list:
+        targets, solution_matched = solution.ResolveTargets(only)
+        self.only_targets[solution.path] = targets
+        matched |= solution_matched
+      unknown = [entry for entry in only if not entry in matched]
+      if unknown:
+        LogError("Unknown project(s) %s." % ", ".join(unknown))
+    shard_count = 1
+    if shard:
+      match = re.match(r"^(\d+)/(\d+)$", str(shard))
+      if not match or not (1 <= int(match.group(1)) <= int(match.group(2))):
+        LogError("Invalid shard \"%s\", expecting i/N with 1 <= i <= N." % shard)
+      self.shard_index = int(match.group(1)) - 1
+      shard_count = int(match.group(2))
+      self.shard_units = self.GetShardUnits(solution_list, shard_count, shard_targets)
+      if shard_targets and need_install:
+        LogWarning("Install is skipped when sharding targets, it needs every target of a configuration.")
+        need_install = False
+    if plan:
+      self.WritePlan(plan, solution_list, shard_count, shard_targets, is_venus3d, need_gen, need_clear, need_build, need_install, additional_options)
+      return
+
+    build_trace.Reset()
+    cache_stats = self.GetCompilerCacheStats()
+    try:
+      names = set([solution.GetName() for solution in solution_list])
+      graph = dict([(solution.GetName(), [depend for depend in solution.GetDepends() if depend in names]) for solution in solution_list])
+
+      def RunSolution(solution):
+        build_info = self
+        if concurrency > 1:
+          # The budget is split between the solutions of one dependency
+          # level. Taken from the graph, not from what happens to be ready,
+          # so the job counts and the configure fingerprint stay the same
+          # from run to run.
+          share = max(1, min(concurrency, widths[levels[solution.GetName()]]))
+          build_info = copy.copy(self)
+          build_info.env_cfgs = dict(self.env_cfgs)
+          build_info.parallel = max(1, self.parallel // share)
+          build_info.jobs = max(1, self.jobs // share)
+          build_info.compile_jobs = max(1, self.compile_jobs // share)
+          build_info.link_jobs = max(1, self.link_jobs // share)
+          build_info.tag_output = True
+        build_info.BuildSolution(solution, is_venus3d, need_gen, need_clear, need_build, need_install, additional_options)
+
+      tasks = [BuildTask(solution.GetName(), lambda solution = solution: RunSolution(solution), graph[solution.GetName()]) for solution in solution_list]
+      levels = GetTaskLevels(tasks)
+      widths = GetTaskWidths(tasks)
+      concurrency = max(1, min(self.parallel, max(list(widths.values()) + [1])))
+      RunTasks(tasks, concurrency)
+    finally:
+      build_trace.WriteChromeTrace("Logs/build_trace_%s.json" % time.strftime("%Y_%m_%d_%H_%M_%S", time.localtime()))
+      build_trace.PrintSummary()
+      self.PrintCompilerCacheStats(cache_stats)
+
+  def BeginBuildHistory(self, run):
+    import BuildReport
+    run["log"] = BuildReport.GetNinjaLogMarker(run["build_dir"]) if run["ninja"] else None
+    run["start"] = time.time()
+
+  def RecordBuildHistory(self, run):
+    import BuildReport
+    run["end"] = time.time()
+    # Relative to the build path of the solution, next to its build dirs
+    db_path = os.path.join(os.path.dirname(run["build_dir"]), self.build_history)
+    try:
+      BuildReport.RecordBuild(db_path, run, self.regression_threshold)
+    except Exception as e:
+      LogWarning("Build history of %s not recorded: %s" % (os.path.basename(run["build_dir"]), e))
+
+  def BeginTimeTrace(self, trace):
+    trace["start"] = time.time()
+
+  def WriteTimeTrace(self, trace):
+    import BuildReport
+    # Whole seconds, some file systems store coarse modification times
+    BuildReport.WriteTimeTrace(trace["build_dir"], trace["name"], since = int(trace["start"]))
+
+  def AddArtifactCache(self, pipeline, root_path, excludes, outputs, build_dir, need_install, inputs):
+    texts = ["%s%d" % (self.compiler_name, self.compiler_version)]
+    for command in pipeline.GetCommands():
+      texts += GetStableScript(command["script"])
+    cell = {
+      "name" : pipeline.name,
+      "root_path" : root_path,
+      "excludes" : [os.path.abspath(path) for path in excludes + ["Logs"]],
+      "outputs" : outputs,
+      "build_dir" : build_dir,
+      "install" : need_install,
+      "inputs" : inputs,
+      "texts" : texts
+    }
+    pipeline.steps = [(self.RunCached, (cell, pipeline.steps))]
+
+  def BeginBuildStamp(self, stamp):
+    stamp["sources"] = GetSourceStamps(stamp["root_path"], stamp["excludes"])
+
+  def WriteBuildStamp(self, stamp):
+    WriteJsonFile("%s/VeBuild.json" % stamp["build_dir"], stamp)
+
+  def AddBuildStamp(self, pipeline, root_path, excludes, build_dir, outputs):
+    stamp = { "root_path" : root_path, "excludes" : [os.path.abspath(path) for path in excludes + ["Logs"]], "build_dir" : build_dir, "outputs" : outputs }
+    pipeline.steps.insert(0, (self.BeginBuildStamp, (stamp,)))
+    pipeline.AddCall(self.WriteBuildStamp, stamp)
+
+  def RunCached(self, cell, steps):
+    EnsureDirectory(cell["build_dir"])
+    # Only files whose stamp moved since the last run are read again
+    hashes_file = "%s/VeSourceHashes.json" % cell["build_dir"]
+    LoadFileHashes(hashes_file)
+    files = cell["inputs"] + ListSourceFiles(cell["root_path"], cell["excludes"])
+    key = GetFingerprint(cell["texts"], files)
+    SaveFileHashes(hashes_file, files)
+    archive = "%s/artifact_%s.tar" % (cell["build_dir"], key)
+    start = time.time()
+    try:
+      if self.artifact_store.Fetch(key, archive):
+        self.UnpackArtifacts(archive, cell["root_path"])
+        LogInfo("%s restored from artifact cache (%s).\n" % (cell["name"], key[0:12]))
+        build_trace.Add("Restore %s" % cell["name"], start, time.time(), 0, 0, [])
+        return
+      for func, args in steps:
+        func(*args)
+      self.PackArtifacts(archive, cell)
+      self.artifact_store.Store(key, archive)
+    finally:
+      if os.path.isfile(archive): os.remove(archive)
+
+  def PackArtifacts(self, archive, cell):
+    paths = [output for output in cell["outputs"] if os.path.isdir(output)]
+    if cell["install"]:
+      for manifest in glob.glob("%s/install_manifest*.txt" % cell["build_dir"]):
+        with open(manifest, "r", encoding="utf-8") as file:
+          paths += [line.strip() for line in file if line.strip()]
+    with tarfile.open(archive, "w") as tar:
+      for path in paths:
+        rel_path = os.path.relpath(path, cell["root_path"]).replace("\\", "/")
+        if rel_path.startswith("../") or not os.path.lexists(path): continue
+        tar.add(path, arcname = rel_path)
+
+  def UnpackArtifacts(self, archive, root_path):
+    with tarfile.open(archive, "r") as tar:
+      members = tar.getmembers()
+      for member in members:
+        if os.path.isabs(member.name) or ".." in member.name.split("/"):
+          LogError("Unsafe path \"%s\" in artifact \"%s\"." % (member.name, archive))
+        target = os.path.join(root_path, member.name)
+        # Never write through a hardlink into the original file
+        if not member.isdir() and os.path.lexists(target) and not os.path.isdir(target):
+          os.remove(target)
+      if hasattr(tarfile, "data_filter"):
+        tar.extractall(root_path, members, filter = "tar")
+      else:
+        tar.extractall(root_path, members)
 
-  def BuildSolution(self, solution, is_venus3d = False, need_gen = False, need_clear = False, need_build = False, need_install = False, additional_options = ""):
+  def GetShardUnits(self, solution_list, shard_count, shard_targets):
+    units = []
+    for solution in solution_list:
+      for compiler_info in self.compilers:
+        for config in self.cfg:
+          cell = "%s/%s/%s" % (solution.GetName(), compiler_info.arch, config)
+          if shard_targets:
+            units += ["%s/%s" % (cell, target) for target in solution.GetTargets()]
+          else:
+            units.append(cell)
+    units.sort()
+    return dict([(unit, i % shard_count) for i, unit in enumerate(units)])
+
+  def IsInShard(self, solution, arch, config):
+    if self.shard_units is None: return True
+    cell = "%s/%s/%s" % (solution.GetName(), arch, config)
+    return any(self.shard_units[unit] == self.shard_index for unit in self.shard_units if unit == cell or unit.startswith(cell + "/"))
+
+  def GetShardTargets(self, solution, arch, config):
+    if self.shard_units is None: return None
+    cell = "%s/%s/%s" % (solution.GetName(), arch, config)
+    if cell in self.shard_units: return None
+    return [unit[len(cell) + 1:] for unit in sorted(self.shard_units) if unit.startswith(cell + "/") and self.shard_units[unit] == self.shard_index]
+
+  def GetBuildTargets(self, solution, arch, config):
+    targets = self.GetShardTargets(solution, arch, config)
+    if self.only_targets is not None:
+      only_targets = self.only_targets.get(solution.path, [])
+      if targets is None: targets = only_targets
+      else: targets = [target for target in targets if target in only_targets]
+    return targets
+
+  def WritePlan(self, plan, solution_list, shard_count, shard_targets, is_venus3d, need_gen, need_clear, need_build, need_install, additional_options):
+    shards = []
+    for shard_index in range(0, shard_count):
+      self.shard_index = shard_index
+      pipelines = []
+      for solution in solution_list:
+        self.BuildSolution(solution, is_venus3d, need_gen, need_clear, need_build, need_install, additional_options, pipelines)
+      units = []
+      if self.shard_units is not None:
+        units = sorted([unit for unit in self.shard_units if self.shard_units[unit] == shard_index])
+      shards.append({ "index" : shard_index + 1, "units" : units, "pipelines" : pipelines })
+    content = { "shard_count" : shard_count, "shard_targets" : shard_targets, "shards" : shards }
+    if "-" == plan:
+      WriteOutput(json.dumps(content, indent = 1, sort_keys = True) + "\n")
+    else:
+      EnsureDirectory(os.path.dirname(os.path.abspath(plan)))
+      WriteJsonFile(plan, content)
+      LogInfo("Build plan written to \"%s\"." % plan)
+
+  def BuildSolution(self, solution, is_venus3d = False, need_gen = False, need_clear = False, need_build = False, need_install = False, additional_options = "", plan = None):
     curdir = os.path.abspath(os.curdir)
     if is_venus3d: self.SetConfig("venus3d_path", curdir)
     self.SetConfig("need_gen", str(need_gen).upper())
@@ -990,7 +1973,11 @@ class BuildInfo:
     self.SetConfig("install_path", install_path)
     venus_build_path = os.path.abspath(self.GetConfig("venus_build_path", "Build"))
     self.SetConfig("venus_build_path", venus_build_path)
-    solution.GenCMake(build_path, need_clear)
+    if plan is None:
+      for trash_dir in glob.glob("%s/.venus_trash" % root_path) + glob.glob("%s/.venus_trash" % build_path) + glob.glob("%s/gen_*/.venus_trash" % build_path):
+        SweepTrash(trash_dir)
+      solution.GenCMake(build_path, need_clear)
+      if self.seed_toolchain and not self.multi_config: solution.GenDetectCMake(build_path)
     if self.prefer_shared:
       self.SetConfig("prefer_lib", "SHARED")
     else:
@@ -999,6 +1986,7 @@ class BuildInfo:
       self.SetConfig("build_lib", "SHARED")
     else:
       self.SetConfig("build_lib", "STATIC")
+    if plan is None: EnsureDirectory(binary_path, need_clear, False)
 
     toolset_name = ""
     if 0 == self.project_type.find("vs"):
@@ -1011,7 +1999,44 @@ class BuildInfo:
     elif ("android" == self.target_platform):
       toolset_name = "clang"
 
+    compiler_launcher = self.compiler_launcher
+    if self.time_trace and self.compiler_name in ("gcc", "mgw"):
+      # GCC prints its time report to stderr, the launcher keeps it per object
+      report_launcher = [sys.executable, "%s/BuildReport.py" % os.path.dirname(os.path.abspath(__file__)), "time-report"]
+      compiler_launcher = ";".join([arg.replace("\\", "/") for arg in report_launcher] + ([compiler_launcher] if compiler_launcher else []))
+    if compiler_launcher:
+      if 0 == self.project_type.find("vs") or "xcode" == self.project_type:
+        LogWarning("Compiler launcher is not supported by Visual Studio and Xcode generators, ignored.")
+      else:
+        additional_options += " -DCMAKE_C_COMPILER_LAUNCHER=\"%s\"" % compiler_launcher
+        additional_options += " -DCMAKE_CXX_COMPILER_LAUNCHER=\"%s\"" % compiler_launcher
+
+    if self.compiler_name != "vc":
+      linker = self.linker or solution.GetConfig("linker", "default")
+      split_debug = self.split_debug
+      if split_debug is None: split_debug = solution.GetConfig("split_debug", False)
+      additional_options += " -DBUILD_LINKER=\"%s\"" % linker
+      additional_options += " -DBUILD_SPLIT_DEBUG=%s" % ("ON" if split_debug else "OFF")
+      additional_options += " -DBUILD_TIME_TRACE=%s" % ("ON" if self.time_trace else "OFF")
+
+    if self.multi_config:
+      pipeline_count = len(self.compilers)
+    else:
+      pipeline_count = len(self.compilers) * len(self.cfg)
+    parallel = min(self.parallel, max(1, pipeline_count))
+    jobs = max(1, self.compile_jobs // parallel)
+    if self.compiler_name != "vc":
+      # Pool sizes come from the memory probe here, CMake only applies them
+      additional_options += " -DBUILD_COMPILE_JOBS=%d" % jobs
+      additional_options += " -DBUILD_LINK_JOBS=%d" % max(1, self.link_jobs // parallel)
+      additional_options += " -DBUILD_PYTHON=\"%s\"" % sys.executable.replace("\\", "/")
+
+    detect_tasks = []
+    gen_tasks = []
+    build_pipelines = []
+    super_options = additional_options
     for compiler_info in self.compilers:
+      additional_options = super_options
       if self.compiler_name != "vc":
         additional_options += " -DBUILD_ARCH_NAME=\"%s\"" % compiler_info.arch
       if "android" == self.target_platform:
@@ -1058,26 +2083,31 @@ class BuildInfo:
       if self.lib_shared:
         compile_info += "_shared"
       self.SetConfig("compile_info", compile_info)
+      env_cfgs = dict(self.env_cfgs)
 
       if self.multi_config:
+        configs = [config for config in self.cfg if self.IsInShard(solution, compiler_info.arch, config)]
+        if not configs: continue
         if 0 == self.project_type.find("vs"):
           additional_options += " -A %s" % vc_arch
         if self.compiler_name == "clangcl":
           additional_options += " -DClangCL_Path=\"" + compiler_info.compiler_root + "../../Tools/Llvm/bin/\""
+        if "ninja_multi" == self.project_type:
+          if "clang" == self.compiler_name:
+            if not ("CC" in os.environ):
+              additional_options += " -DCMAKE_C_COMPILER=clang"
+            if not ("CXX" in os.environ):
+              additional_options += " -DCMAKE_CXX_COMPILER=clang++"
+          # Every config goes into the one tree, shards only pick what to build
+          additional_options += " -DCMAKE_CONFIGURATION_TYPES=\"%s\"" % ";".join(self.cfg)
 
-        for generate in solution.GetGenerates():
-          gen_dir = os.path.abspath("%s/gen_%s/%s" % (build_path,  compile_info, generate[0]))
-          EnsureDirectory(gen_dir, need_clear)
-          os.chdir(gen_dir)
-          gen_cmd = BatchCommand("Generate %s" % generate[0], self.env_cfgs)
-          gen_cmd.AddCommand("\"%s\" -G \"%s\" %s %s %s \"%s\"" % (self.cmake_path, compiler_info.generator, toolset_name, additional_options, generate[2], generate[1]))
-          gen_cmd.ExecuteEx(0, "gen_%s" % generate[0], "Logs")
+        self.AddGenerateTasks(gen_tasks, solution, build_path, compile_info, env_cfgs,
+          "-G \"%s\" %s %s" % (compiler_info.generator, toolset_name, additional_options), self.cfg[0], need_clear)
 
         build_dir = os.path.abspath("%s/%s" % (build_path, compile_info))
-        EnsureDirectory(build_dir, need_clear)
-        EnsureDirectory(binary_path, need_clear, False)
-        os.chdir(build_dir)
-        cmake_cmd = BatchCommand("CMake %s" % solution.GetName(), self.env_cfgs)
+        pipeline = BuildPipeline("%s %s" % (solution.GetName(), compile_info))
+        pipeline.AddCall(EnsureDirectory, build_dir, need_clear)
+        cmake_cmd = BatchCommand("CMake %s" % solution.GetName(), env_cfgs, build_dir)
         new_path = sys.exec_prefix
         if len(compiler_info.compiler_root) > 0:
           new_path += ";" + compiler_info.compiler_root
@@ -1090,34 +2120,79 @@ class BuildInfo:
           cmake_cmd.AddCommand('export PATH=$PATH:%s' % new_path)
 
         cmake_cmd.AddCommand('"%s" -G "%s" %s %s ../cmake' % (self.cmake_path, compiler_info.generator, toolset_name, additional_options))
-        cmake_cmd.ExecuteEx(0, "cmake_%s" % solution.GetName().lower(), "Logs")
-
-        if need_build:
-          build_cmd = BatchCommand("Build %s" % solution.GetName(), self.env_cfgs)
+        pipeline.AddCall(self.Configure, cmake_cmd, "cmake_%s" % solution.GetName().lower(), build_dir,
+          self.GetConfigureInputs(solution, build_path, additional_options))
+
+        config_targets = []
+        full_build = all([self.GetBuildTargets(solution, compiler_info.arch, config) is None for config in configs])
+        for config in configs:
+          targets = self.GetBuildTargets(solution, compiler_info.arch, config)
+          if targets is None: targets = ["ALL_BUILD"]
+          if targets: config_targets.append((config, targets))
+        trace = { "build_dir" : build_dir, "name" : pipeline.name }
+        if need_build and config_targets and "ninja_multi" == self.project_type:
+          if self.time_trace:
+            pipeline.AddCall(self.BeginTimeTrace, trace)
+          for config, targets in config_targets:
+            build_cmd = BatchCommand("Build %s %s" % (solution.GetName(), config), env_cfgs, build_dir)
+            self.MakeAddBuildCommand(build_cmd, "ninja -f build-%s.ninja" % config, " ".join(targets), jobs)
+            history = {
+              "solution" : solution.GetName(),
+              "compile_info" : compile_info,
+              "config" : config,
+              "build_dir" : build_dir,
+              "root_path" : root_path,
+              "jobs" : jobs,
+              "ninja" : "ninja",
+              "ninja_file" : "build-%s.ninja" % config
+            }
+            if self.build_history:
+              pipeline.AddCall(self.BeginBuildHistory, history)
+            pipeline.AddBatch(build_cmd, 0, "build_%s_%s" % (solution.GetName().lower(), config.lower()))
+            if self.build_history:
+              pipeline.AddCall(self.RecordBuildHistory, history)
+          if self.time_trace:
+            pipeline.AddCall(self.WriteTimeTrace, trace)
+        elif need_build and config_targets:
+          build_cmd = BatchCommand("Build %s" % solution.GetName(), env_cfgs, build_dir)
           if 0 == self.project_type.find("vs"):
             build_cmd.AddCommand('@CALL "%s%s" %s' % (compiler_info.compiler_root, compiler_info.vcvarsall_path, vc_option))
             build_cmd.AddCommand('@CD /d "%s"' % build_dir)
-          for config in self.cfg:
-            if 0 == self.project_type.find("vs"):
-              self.MSBuildAddBuildCommand(build_cmd, solution.GetName(), "ALL_BUILD", config, vc_arch)
-            elif "xcode" == self.project_type:
-              self.XCodeBuildAddBuildCommand(build_cmd, "ALL_BUILD", config)
-          build_cmd.ExecuteEx(3, "build_%s" % solution.GetName().lower(), "Logs")
+          for config, targets in config_targets:
+            for target in targets:
+              if 0 == self.project_type.find("vs"):
+                self.MSBuildAddBuildCommand(build_cmd, solution.GetName(), target, config, vc_arch, jobs)
+              elif "xcode" == self.project_type:
+                self.XCodeBuildAddBuildCommand(build_cmd, target, config, jobs)
+          if self.time_trace:
+            pipeline.AddCall(self.BeginTimeTrace, trace)
+          pipeline.AddBatch(build_cmd, 3, "build_%s" % solution.GetName().lower())
+          if self.time_trace:
+            pipeline.AddCall(self.WriteTimeTrace, trace)
 
         if need_install:
-          install_cmd = BatchCommand("Install %s" % solution.GetName(), self.env_cfgs)
+          install_cmd = BatchCommand("Install %s" % solution.GetName(), env_cfgs, build_dir)
           if 0 == self.project_type.find("vs"):
             install_cmd.AddCommand('@CALL "%s%s" %s' % (compiler_info.compiler_root, compiler_info.vcvarsall_path, vc_option))
             install_cmd.AddCommand('@CD /d "%s"' % build_dir)
-          for config in self.cfg:
+          for config in configs:
             if 0 == self.project_type.find("vs"):
-              self.MSBuildAddBuildCommand(install_cmd, solution.GetName(), "INSTALL", config, vc_arch)
+              self.MSBuildAddBuildCommand(install_cmd, solution.GetName(), "INSTALL", config, vc_arch, jobs)
             elif "xcode" == self.project_type:
-              self.XCodeBuildAddBuildCommand(install_cmd, "install", config)
-          install_cmd.ExecuteEx(0, "install_%s" % solution.GetName().lower(), "Logs")
-
-        os.chdir(curdir)
-        sys.stdout.flush()
+              self.XCodeBuildAddBuildCommand(install_cmd, "install", config, jobs)
+            else:
+              self.MakeAddBuildCommand(install_cmd, "ninja -f build-%s.ninja" % config, "install", jobs)
+            # Every config rewrites install_manifest.txt, keep one per config for the artifact cache
+            install_cmd.AddCommand("\"%s\" -E copy install_manifest.txt install_manifest_%s.txt" % (self.cmake_path, config))
+          pipeline.AddBatch(install_cmd, 0, "install_%s" % solution.GetName().lower())
+        if self.artifact_store and need_build and plan is None:
+          self.AddArtifactCache(pipeline, root_path, [binary_path, build_path, install_path, document_path],
+            ["%s/%s/%s" % (binary_path, compile_info, config) for config in configs], build_dir, need_install,
+            self.GetConfigureInputs(solution, build_path, additional_options))
+        if need_build and full_build and plan is None:
+          self.AddBuildStamp(pipeline, root_path, [binary_path, build_path, install_path, document_path], build_dir,
+            ["%s/%s/%s" % (binary_path, compile_info, config) for config in configs])
+        build_pipelines.append(pipeline)
       else:
         if self.project_type == "ninja":
           if "android" == self.target_platform:
@@ -1136,10 +2211,11 @@ class BuildInfo:
           else:
             make_name = "make"
 
-        super_options = additional_options
+        arch_options = additional_options
         first = True
         for config in self.cfg:
-          additional_options = super_options
+          if not self.IsInShard(solution, compiler_info.arch, config): continue
+          additional_options = arch_options
           if self.target_platform == "android":
             additional_options += " -DCMAKE_MAKE_PROGRAM=\"%s\"" % make_name
           elif "clang" == self.compiler_name:
@@ -1171,37 +2247,83 @@ class BuildInfo:
 
           if first:
             first = False
-            for generate in solution.GetGenerates():
-              gen_dir = os.path.abspath("%s/gen_%s/%s" % (build_path,  compile_info, generate[0]))
-              EnsureDirectory(gen_dir, need_clear)
-              os.chdir(gen_dir)
-              gen_cmd = BatchCommand("Generate %s" % generate[0], self.env_cfgs)
-              gen_cmd.AddCommand("\"%s\" -G \"%s\" %s %s \"%s\"" % (self.cmake_path, compiler_info.generator, additional_options, generate[2], generate[1]))
-              gen_cmd.ExecuteEx(0, "gen_%s" % generate[0], "Logs")
+            seed_dir = None
+            if self.seed_toolchain:
+              seed_dir = self.AddDetectTask(detect_tasks, solution, build_path, compile_info, env_cfgs, compiler_info.generator, additional_options, need_clear)
+            seed_options = " -C \"%s/VeSeed.cmake\"" % seed_dir if seed_dir else ""
+            self.AddGenerateTasks(gen_tasks, solution, build_path, compile_info, env_cfgs,
+              "-G \"%s\" %s%s" % (compiler_info.generator, additional_options, seed_options), config, need_clear, seed_dir)
 
           build_dir = os.path.abspath("%s/%s-%s" % (build_path, compile_info, config.lower()))
-          EnsureDirectory(build_dir, need_clear)
-          EnsureDirectory(binary_path, need_clear, False)
-          os.chdir(build_dir)
-          cmake_cmd = BatchCommand("CMake %s %s" % (solution.GetName(), config), self.env_cfgs)
-          cmake_cmd.AddCommand("\"%s\" -G \"%s\" %s ../cmake" % (self.cmake_path, compiler_info.generator, additional_options))
-          cmake_cmd.ExecuteEx(0, "cmake_%s_%s" % (solution.GetName().lower(), config.lower()), "Logs")
-
-          if need_build:
-            build_cmd = BatchCommand("Build %s %s" % (solution.GetName(), config), self.env_cfgs)
+          pipeline = BuildPipeline("%s %s-%s" % (solution.GetName(), compile_info, config.lower()))
+          pipeline.AddCall(EnsureDirectory, build_dir, need_clear)
+          if seed_dir: pipeline.AddCall(self.SeedBuildDirectory, seed_dir, build_dir)
+          cmake_cmd = BatchCommand("CMake %s %s" % (solution.GetName(), config), env_cfgs, build_dir)
+          cmake_cmd.AddCommand("\"%s\" -G \"%s\" %s%s ../cmake" % (self.cmake_path, compiler_info.generator, additional_options, seed_options))
+          pipeline.AddCall(self.Configure, cmake_cmd, "cmake_%s_%s" % (solution.GetName().lower(), config.lower()), build_dir,
+            self.GetConfigureInputs(solution, build_path, additional_options))
+
+          targets = self.GetBuildTargets(solution, compiler_info.arch, config)
+          full_build = targets is None
+          if targets is None: targets = ["ALL_BUILD"]
+          if need_build and targets:
+            build_cmd = BatchCommand("Build %s %s" % (solution.GetName(), config), env_cfgs, build_dir)
             if self.compiler_name == "vc":
               build_cmd.AddCommand('@CALL "%s%s" %s' % (compiler_info.compiler_root, compiler_info.vcvarsall_path, vc_option))
               build_cmd.AddCommand('@CD /d "%s"' % build_dir)
-            self.MakeAddBuildCommand(build_cmd, make_name, "ALL_BUILD")
-            build_cmd.ExecuteEx(0, "build_%s_%s" % (solution.GetName().lower(), config.lower()), "Logs")
+            self.MakeAddBuildCommand(build_cmd, make_name, " ".join(targets), jobs)
+            history = {
+              "solution" : solution.GetName(),
+              "compile_info" : compile_info,
+              "config" : config,
+              "build_dir" : build_dir,
+              "root_path" : root_path,
+              "jobs" : jobs,
+              "ninja" : make_name if "ninja" == self.project_type else None
+            }
+            trace = { "build_dir" : build_dir, "name" : pipeline.name }
+            if self.build_history:
+              pipeline.AddCall(self.BeginBuildHistory, history)
+            if self.time_trace:
+              pipeline.AddCall(self.BeginTimeTrace, trace)
+            pipeline.AddBatch(build_cmd, 0, "build_%s_%s" % (solution.GetName().lower(), config.lower()))
+            if self.build_history:
+              pipeline.AddCall(self.RecordBuildHistory, history)
+            if self.time_trace:
+              pipeline.AddCall(self.WriteTimeTrace, trace)
 
           if need_install:
-            install_cmd = BatchCommand("Install %s %s" % (solution.GetName(), config), self.env_cfgs)
+            install_cmd = BatchCommand("Install %s %s" % (solution.GetName(), config), env_cfgs, build_dir)
             if self.compiler_name == "vc":
               install_cmd.AddCommand('@CALL "%s%s" %s' % (compiler_info.compiler_root, compiler_info.vcvarsall_path, vc_option))
               install_cmd.AddCommand('@CD /d "%s"' % build_dir)
-            self.MakeAddBuildCommand(install_cmd, make_name, "install")
-            install_cmd.ExecuteEx(0, "install_%s_%s" % (solution.GetName().lower(), config.lower()), "Logs")
-
-          os.chdir(curdir)
-          sys.stdout.flush()
+            self.MakeAddBuildCommand(install_cmd, make_name, "install", jobs)
+            pipeline.AddBatch(install_cmd, 0, "install_%s_%s" % (solution.GetName().lower(), config.lower()))
+          if self.artifact_store and need_build and plan is None:
+            self.AddArtifactCache(pipeline, root_path, [binary_path, build_path, install_path, document_path],
+              ["%s/%s/%s" % (binary_path, compile_info, config)], build_dir, need_install,
+              self.GetConfigureInputs(solution, build_path, additional_options))
+          if need_build and full_build and plan is None:
+            self.AddBuildStamp(pipeline, root_path, [binary_path, build_path, install_path, document_path], build_dir,
+              ["%s/%s/%s" % (binary_path, compile_info, config)])
+          build_pipelines.append(pipeline)
+
+    if plan is not None:
+      for pipeline in [task.func.__self__ for task in detect_tasks + gen_tasks] + build_pipelines:
+        plan.append({ "name" : pipeline.name, "commands" : pipeline.GetCommands() })
+      return
+    for pipeline in build_pipelines:
+      pipeline.tag_output = self.tag_output or parallel > 1
+    RunTasks(detect_tasks, self.parallel)
+    RunTasks(gen_tasks, self.parallel)
+    RunTasks([BuildTask(pipeline.name, pipeline.Run) for pipeline in build_pipelines], parallel)
+
+if __name__ == "__main__":
+  if len(sys.argv) > 2 and "check" == sys.argv[1]:
+    options = dict([arg.partition("=")[0::2] for arg in sys.argv[3:]])
+    sys.exit(CheckSolutions(sys.argv[2], options.get("path", "."), options.get("build_dir_name", "build"), options.get("compile_info", ""),
+      options.get("quiet", "false").lower() == "true"))
+  else:
+    # "python -m BuildCheck ..." runs the same check without loading this module
+    print("Usage: python -m BuildUtil check <solutions> [path=<dir>] [build_dir_name=build] [compile_info=<prefix>] [quiet=true]")
+    sys.exit(1)
@@ -14,6 +14,23 @@ SET(BUILD_LIB $ENV{BUILD_LIB})
 SET(COMPILE_INFO $ENV{COMPILE_INFO})
 
 SET_PROPERTY(GLOBAL PROPERTY USE_FOLDERS ON)
+SET(STAGE_FILE_SCRIPT ${CMAKE_CURRENT_LIST_DIR}/StageFile.cmake)
+
+# Job pools sized by the build script from the available memory, 0 leaves
+# the build unlimited. Ninja gets real pools, Makefiles have none so links
+# hold one of BUILD_LINK_JOBS lock slots through BuildReport.py link-slot.
+SET(BUILD_COMPILE_JOBS 0 CACHE STRING "Concurrent compile jobs of this build")
+SET(BUILD_LINK_JOBS 0 CACHE STRING "Concurrent link jobs of this build")
+SET(BUILD_PYTHON "" CACHE FILEPATH "Python running the build script")
+IF(BUILD_COMPILE_JOBS GREATER 0 AND BUILD_LINK_JOBS GREATER 0)
+  IF(CMAKE_GENERATOR MATCHES "Ninja")
+    SET_PROPERTY(GLOBAL APPEND PROPERTY JOB_POOLS compile_pool=${BUILD_COMPILE_JOBS} link_pool=${BUILD_LINK_JOBS})
+    SET(BUILD_JOB_POOLS TRUE)
+  ELSEIF(CMAKE_GENERATOR MATCHES "Makefiles" AND BUILD_PYTHON AND BUILD_LINK_JOBS LESS BUILD_COMPILE_JOBS)
+    SET_PROPERTY(GLOBAL PROPERTY RULE_LAUNCH_LINK "\"${BUILD_PYTHON}\" \"${VENUS_BUILD_PATH}/BuildReport.py\" link-slot \"${CMAKE_BINARY_DIR}/CMakeFiles/link_slots\" ${BUILD_LINK_JOBS}")
+  ENDIF()
+  MESSAGE(STATUS "Job pools: compile ${BUILD_COMPILE_JOBS}, link ${BUILD_LINK_JOBS}")
+ENDIF()
 
 MACRO(TO_FILE_LIST __out _files _path)
   FOREACH(_F ${_files})
@@ -117,13 +134,10 @@ MACRO(INSTALL_PLUGIN_UNITY _name)
       LIBRARY DESTINATION ${INSTALL_PATH}/${_name}/Plugins/iOS
       ARCHIVE DESTINATION ${INSTALL_PATH}/${_name}/Plugins/iOS)
   ELSEIF(BUILD_PLATFORM_ANDROID)
-    IF(CMAKE_BUILD_TYPE STREQUAL "RelWithDebInfo")
-      INSTALL(TARGETS ${_name}
-        LIBRARY DESTINATION ${INSTALL_PATH}/${_name}/Plugins/Android/libs/${ANDROID_ABI})
-    ELSEIF(CMAKE_BUILD_TYPE STREQUAL "Release")
-      INSTALL(TARGETS ${_name}
-          LIBRARY DESTINATION ${INSTALL_PATH}/${_name}/Plugins/Android/libs/${ANDROID_ABI}_no_symbols)
-    ENDIF()
+    INSTALL(TARGETS ${_name} CONFIGURATIONS RelWithDebInfo
+      LIBRARY DESTINATION ${INSTALL_PATH}/${_name}/Plugins/Android/libs/${ANDROID_ABI})
+    INSTALL(TARGETS ${_name} CONFIGURATIONS Release
+      LIBRARY DESTINATION ${INSTALL_PATH}/${_name}/Plugins/Android/libs/${ANDROID_ABI}_no_symbols)
   ENDIF()
 ENDMACRO()
 
@@ -168,28 +182,40 @@ MACRO(LINK_MULTI_LIB __out _name _lib _path)
       SET(_C_LIB $<$<CONFIG:${_C}>:${_path}/${COMPILE_INFO}/${_C}/${LIB_NAME}>)
       TARGET_LINK_LIBRARIES(${_name} ${_C_LIB})
       LIST(APPEND ${__out} ${_C_LIB})
-      IF(EXT_LIB_SHARED)
-        IF(EXISTS ${_path}/${COMPILE_INFO}/${_C}/${DLL_NAME})
-          FILE(COPY ${_path}/${COMPILE_INFO}/${_C}/${DLL_NAME}
-            DESTINATION ${OUTPUT_PATH}/${_C})
-        ENDIF()
-        IF(EXISTS ${_path}/${COMPILE_INFO}/${_C}/${_lib}.pdb)
-          FILE(COPY ${_path}/${COMPILE_INFO}/${_C}/${_lib}.pdb
-            DESTINATION ${OUTPUT_PATH}/${_C})
-        ENDIF()
-      ENDIF()
     ENDFOREACH()
+    IF(EXT_LIB_SHARED AND NOT TARGET stage_${_lib})
+      ADD_CUSTOM_TARGET(stage_${_lib}
+        COMMAND ${CMAKE_COMMAND} -DSTAGE_SOURCE=${_path}/${COMPILE_INFO}/$<CONFIG>/${DLL_NAME}
+          -DSTAGE_DESTINATION=${OUTPUT_PATH}/$<CONFIG> -P ${STAGE_FILE_SCRIPT}
+        COMMAND ${CMAKE_COMMAND} -DSTAGE_SOURCE=${_path}/${COMPILE_INFO}/$<CONFIG>/${_lib}.pdb
+          -DSTAGE_DESTINATION=${OUTPUT_PATH}/$<CONFIG> -P ${STAGE_FILE_SCRIPT}
+        VERBATIM)
+      SET_TARGET_PROPERTIES(stage_${_lib} PROPERTIES FOLDER "Stage")
+    ENDIF()
   ELSE()
     SET(_C_LIB ${_path}/${COMPILE_INFO}/${CMAKE_BUILD_TYPE}/${LIB_NAME})
     TARGET_LINK_LIBRARIES(${_name} ${_C_LIB})
     LIST(APPEND ${__out} ${_C_LIB})
-    IF(EXT_LIB_SHARED)
-      IF(EXISTS ${_path}/${COMPILE_INFO}/${_C}/${DLL_NAME})
-        FILE(COPY ${_path}/${COMPILE_INFO}/${_C}/${DLL_NAME}
-          DESTINATION ${OUTPUT_PATH})
-      ENDIF()
+    IF(EXT_LIB_SHARED AND NOT TARGET stage_${_lib})
+      UNSET(_staged)
+      FOREACH(_F ${DLL_NAME} ${_lib}.pdb)
+        SET(_src ${_path}/${COMPILE_INFO}/${CMAKE_BUILD_TYPE}/${_F})
+        IF(EXISTS ${_src})
+          ADD_CUSTOM_COMMAND(OUTPUT ${OUTPUT_PATH}/${CMAKE_BUILD_TYPE}/${_F}
+            COMMAND ${CMAKE_COMMAND} -DSTAGE_SOURCE=${_src}
+              -DSTAGE_DESTINATION=${OUTPUT_PATH}/${CMAKE_BUILD_TYPE} -P ${STAGE_FILE_SCRIPT}
+            DEPENDS ${_src}
+            VERBATIM)
+          LIST(APPEND _staged ${OUTPUT_PATH}/${CMAKE_BUILD_TYPE}/${_F})
+        ENDIF()
+      ENDFOREACH()
+      ADD_CUSTOM_TARGET(stage_${_lib} DEPENDS ${_staged})
+      SET_TARGET_PROPERTIES(stage_${_lib} PROPERTIES FOLDER "Stage")
     ENDIF()
   ENDIF()
+  IF(TARGET stage_${_lib})
+    ADD_DEPENDENCIES(${_name} stage_${_lib})
+  ENDIF()
 ENDMACRO()
 
 MACRO(LINK_LIBS __out _name _libs)
@@ -224,6 +250,29 @@ MACRO(FIND_FILES _out _paths _wildcards)
   ENDFOREACH()
 ENDMACRO()
 
+MACRO(ADD_COMMON_DEFINITIONS _name)
+  IF(BUILD_LIB MATCHES "SHARED")
+    TARGET_COMPILE_DEFINITIONS(${_name}
+      PRIVATE PREFER_SHARED_LIB)
+  ELSE()
+    TARGET_COMPILE_DEFINITIONS(${_name}
+      PRIVATE PREFER_STATIC_LIB)
+  ENDIF()
+  TARGET_COMPILE_DEFINITIONS(${_name}
+    PRIVATE BUILD_ARCH_${BUILD_ARCH_NAME_UPPER}
+    PRIVATE BUILD_PLATFORM_${BUILD_PLATFORM_NAME_UPPER})
+  IF (NOT CMAKE_CONFIGURATION_TYPES)
+    STRING(TOUPPER ${CMAKE_BUILD_TYPE} _C_UPPER)
+    TARGET_COMPILE_DEFINITIONS(${_name} PRIVATE BUILD_${_C_UPPER})
+  ELSE()
+    UNSET(_C)
+    FOREACH(_C ${CMAKE_CONFIGURATION_TYPES})
+      STRING(TOUPPER ${_C} _C_UPPER)
+      TARGET_COMPILE_DEFINITIONS(${_name} PRIVATE $<$<CONFIG:${_C_UPPER}>:BUILD_${_C_UPPER}>)
+    ENDFOREACH()
+  ENDIF()
+ENDMACRO()
+
 MACRO(ADD_TARGET __out _group _name _files _f_path _defs _incs _libs _no_warn _target)
   FIND_LIBS(${_name} "${_libs}" ${_app})
   SET(_is_bin true)
@@ -312,31 +361,24 @@ MACRO(ADD_TARGET __out _group _name _files _f_path _defs _incs _libs _no_warn _t
       TARGET_COMPILE_OPTIONS(${_name} PRIVATE -W -Wall -Werror)
     ENDIF()
   ENDIF()
-  IF(BUILD_LIB MATCHES "SHARED")
-    TARGET_COMPILE_DEFINITIONS(${_name}
-      PRIVATE PREFER_SHARED_LIB)
-  ELSE()
-    TARGET_COMPILE_DEFINITIONS(${_name}
-      PRIVATE PREFER_STATIC_LIB)
-  ENDIF()
-  TARGET_COMPILE_DEFINITIONS(${_name}
-    PRIVATE BUILD_ARCH_${BUILD_ARCH_NAME_UPPER}
-    PRIVATE BUILD_PLATFORM_${BUILD_PLATFORM_NAME_UPPER})
-  IF (NOT CMAKE_CONFIGURATION_TYPES)
-    STRING(TOUPPER ${CMAKE_BUILD_TYPE} _C_UPPER)
-    TARGET_COMPILE_DEFINITIONS(${_name} PRIVATE BUILD_${_C_UPPER})
-  ELSE()
-    UNSET(_C)
-    FOREACH(_C ${CMAKE_CONFIGURATION_TYPES})
-      STRING(TOUPPER ${_C} _C_UPPER)
-      TARGET_COMPILE_DEFINITIONS(${_name} PRIVATE $<$<CONFIG:${_C_UPPER}>:BUILD_${_C_UPPER}>)
-    ENDFOREACH()
-  ENDIF()
+  ADD_COMMON_DEFINITIONS(${_name})
   FOREACH(_def ${_defs})
     TARGET_COMPILE_DEFINITIONS(${_name}
       PRIVATE ${_def})
   ENDFOREACH()
   SET_TARGET_PROPERTIES(${_name} PROPERTIES FOLDER ${_group})
+  IF(BUILD_TIME_TRACE)
+    IF(CMAKE_CXX_COMPILER_ID MATCHES "Clang" AND NOT MSVC)
+      TARGET_COMPILE_OPTIONS(${_name} PRIVATE -ftime-trace)
+    ELSEIF(CMAKE_CXX_COMPILER_ID STREQUAL "GNU")
+      TARGET_COMPILE_OPTIONS(${_name} PRIVATE -ftime-report)
+    ENDIF()
+  ENDIF()
+  IF(BUILD_JOB_POOLS)
+    SET_TARGET_PROPERTIES(${_name} PROPERTIES
+      JOB_POOL_COMPILE compile_pool
+      JOB_POOL_LINK link_pool)
+  ENDIF()
 ENDMACRO()
 
 MACRO(ADD_APP_WITH_SOURCE _group _name _files _f_path _defs _incs _libs _no_warn _win)
@@ -424,6 +466,33 @@ MACRO(ADD_UNITY_VENUS3D_PLUGIN _group _name _incs)
     "" "${_incs}" "Venus3D")
 ENDMACRO()
 
+FUNCTION(ENABLE_UNITY_BUILD TARGET_NAME BATCH_SIZE EXCLUDES)
+  IF(CMAKE_VERSION VERSION_LESS 3.16)
+    MESSAGE(WARNING "[${TARGET_NAME}] unity build requires CMake 3.16+, ignored")
+    RETURN()
+  ENDIF()
+  SET_TARGET_PROPERTIES(${TARGET_NAME} PROPERTIES
+    UNITY_BUILD ON
+    UNITY_BUILD_BATCH_SIZE ${BATCH_SIZE})
+  GET_TARGET_PROPERTY(_sources ${TARGET_NAME} SOURCES)
+  FOREACH(_exclude ${EXCLUDES})
+    FILE(TO_CMAKE_PATH "/${_exclude}" _suffix)
+    STRING(LENGTH "${_suffix}" _suffix_len)
+    FOREACH(_f ${_sources})
+      FILE(TO_CMAKE_PATH "/${_f}" _path)
+      STRING(LENGTH "${_path}" _path_len)
+      IF(_path_len LESS _suffix_len)
+        CONTINUE()
+      ENDIF()
+      MATH(EXPR _begin "${_path_len} - ${_suffix_len}")
+      STRING(SUBSTRING "${_path}" ${_begin} -1 _tail)
+      IF("${_tail}" STREQUAL "${_suffix}")
+        SET_SOURCE_FILES_PROPERTIES(${_f} PROPERTIES SKIP_UNITY_BUILD_INCLUSION ON)
+      ENDIF()
+    ENDFOREACH()
+  ENDFOREACH()
+ENDFUNCTION()
+
 # TRANSFORM_MAKEFILE_INC
 #
 # This function consumes the "Makefile.inc" autotools file, and converts it into
@@ -1,5 +1,70 @@
 ADD_DEFINITIONS(-DUNICODE -D_UNICODE)
 
+# BUILD_LINKER: default, auto, lld, mold or gold. "auto" takes the first
+# linker the compiler can drive, the others fall back to the default one.
+SET(BUILD_LINKER "default" CACHE STRING "Linker used by GCC/Clang link steps")
+OPTION(BUILD_SPLIT_DEBUG "Split DWARF debug info for Debug/RelWithDebInfo" OFF)
+# BUILD_TIME_TRACE: per translation unit compile time traces, -ftime-trace
+# JSON next to each object on Clang, -ftime-report captured by the build
+# launcher on GCC.
+OPTION(BUILD_TIME_TRACE "Record compile time traces for every translation unit" OFF)
+
+MACRO(SELECT_LINKER)
+  INCLUDE(CheckCXXSourceCompiles)
+  IF(BUILD_LINKER STREQUAL "auto")
+    SET(_linkers mold lld gold)
+  ELSEIF(BUILD_LINKER STREQUAL "default" OR BUILD_LINKER STREQUAL "")
+    SET(_linkers)
+  ELSE()
+    SET(_linkers ${BUILD_LINKER})
+  ENDIF()
+  SET(BUILD_LINKER_NAME "default")
+  FOREACH(_ld ${_linkers})
+    SET(CMAKE_REQUIRED_FLAGS "-fuse-ld=${_ld}")
+    CHECK_CXX_SOURCE_COMPILES("int main() { return 0; }" BUILD_LINKER_${_ld}_WORKS)
+    UNSET(CMAKE_REQUIRED_FLAGS)
+    IF(BUILD_LINKER_${_ld}_WORKS)
+      SET(BUILD_LINKER_NAME ${_ld})
+      BREAK()
+    ENDIF()
+  ENDFOREACH()
+  IF(NOT BUILD_LINKER_NAME STREQUAL "default")
+    FOREACH(flag_var
+      CMAKE_SHARED_LINKER_FLAGS CMAKE_MODULE_LINKER_FLAGS CMAKE_EXE_LINKER_FLAGS)
+      SET(${flag_var} "${${flag_var}} -fuse-ld=${BUILD_LINKER_NAME}")
+    ENDFOREACH()
+  ELSEIF(_linkers)
+    MESSAGE(WARNING "Linker [${BUILD_LINKER}] is not usable, falling back to the default linker.")
+  ENDIF()
+  MESSAGE(STATUS "Linker: ${BUILD_LINKER_NAME}")
+ENDMACRO()
+
+MACRO(ENABLE_SPLIT_DEBUG)
+  INCLUDE(CheckCXXSourceCompiles)
+  SET(_debug_link_flags)
+  SET(_debug_link_checks "-Wl,--compress-debug-sections=zlib")
+  IF(NOT BUILD_LINKER_NAME STREQUAL "default")
+    # BFD has no --gdb-index, gold, lld and mold do
+    LIST(APPEND _debug_link_checks "-Wl,--gdb-index")
+  ENDIF()
+  FOREACH(_flag ${_debug_link_checks})
+    STRING(MAKE_C_IDENTIFIER "OPT${_flag}" _OPTVAR)
+    SET(CMAKE_REQUIRED_FLAGS "${CMAKE_EXE_LINKER_FLAGS} -gsplit-dwarf ${_flag}")
+    CHECK_CXX_SOURCE_COMPILES("int main() { return 0; }" ${_OPTVAR})
+    UNSET(CMAKE_REQUIRED_FLAGS)
+    IF(${_OPTVAR})
+      SET(_debug_link_flags "${_debug_link_flags} ${_flag}")
+    ENDIF()
+  ENDFOREACH()
+  FOREACH(_C DEBUG RELWITHDEBINFO)
+    SET(CMAKE_CXX_FLAGS_${_C} "${CMAKE_CXX_FLAGS_${_C}} -gsplit-dwarf")
+    FOREACH(flag_var
+      CMAKE_SHARED_LINKER_FLAGS_${_C} CMAKE_MODULE_LINKER_FLAGS_${_C} CMAKE_EXE_LINKER_FLAGS_${_C})
+      SET(${flag_var} "${${flag_var}}${_debug_link_flags}")
+    ENDFOREACH()
+  ENDFOREACH()
+ENDMACRO()
+
 IF(MSVC)
   SET(CMAKE_CXX_FLAGS "/EHsc /MP /FS /bigobj /Zc:rvalueCast /Gw")
   IF(CMAKE_C_COMPILER_ID MATCHES Clang)
@@ -211,6 +276,12 @@ ELSE()
       SET(${flag_var} "-s")
     ENDFOREACH()
   ENDIF()
+  IF(NOT (BUILD_PLATFORM_DARWIN OR BUILD_PLATFORM_IOS))
+    SELECT_LINKER()
+    IF(BUILD_SPLIT_DEBUG)
+      ENABLE_SPLIT_DEBUG()
+    ENDIF()
+  ENDIF()
 ENDIF()
 
 SET(CMAKE_C_FLAGS_DEBUG ${CMAKE_CXX_FLAGS_DEBUG})
@@ -282,7 +353,32 @@ FUNCTION(CREATE_PROJECT_USERFILE PROJECTNAME TARGETNAME)
   ENDIF()
 ENDFUNCTION()
 
+# ADD_PRECOMPILED_HEADER(<target> <header> [<reuse_from_target>|SHARED])
+#
+# SHARED compiles <header> once in a host object library and reuses it for
+# every target with the same header file and the same compile flags.
+# A PCH is only reused between targets whose flags match exactly.
 FUNCTION(ADD_PRECOMPILED_HEADER TARGET_NAME PRECOMPILED_HEADER)
+  SET(reuse_target "${ARGV2}")
+  IF(reuse_target AND NOT CMAKE_VERSION VERSION_LESS 3.16 AND NOT (BUILD_PLATFORM_DARWIN OR BUILD_PLATFORM_IOS))
+    IF("${reuse_target}" STREQUAL "SHARED")
+      ADD_SHARED_PRECOMPILED_HEADER(reuse_target ${TARGET_NAME} "${PRECOMPILED_HEADER}")
+    ENDIF()
+    IF(TARGET ${reuse_target})
+      GET_PCH_FLAGS(target_flags ${TARGET_NAME})
+      GET_PCH_FLAGS(reuse_flags ${reuse_target})
+      IF("${target_flags}" STREQUAL "${reuse_flags}")
+        TARGET_PRECOMPILE_HEADERS(${TARGET_NAME} REUSE_FROM ${reuse_target})
+        RETURN()
+      ENDIF()
+      MESSAGE(WARNING "[${TARGET_NAME}] compile flags differ from [${reuse_target}], precompiled header not reused")
+    ELSE()
+      MESSAGE(WARNING "[${TARGET_NAME}] can not reuse precompiled header from unknown target [${reuse_target}]")
+    ENDIF()
+  ENDIF()
+  IF("${PRECOMPILED_HEADER}" STREQUAL "")
+    RETURN()
+  ENDIF()
   GET_FILENAME_COMPONENT(pch_name ${PRECOMPILED_HEADER} NAME)
   GET_TARGET_PROPERTY(source_list ${TARGET_NAME} SOURCES)
   IF(EXISTS ${PRECOMPILED_HEADER})
@@ -296,15 +392,89 @@ FUNCTION(ADD_PRECOMPILED_HEADER TARGET_NAME PRECOMPILED_HEADER)
       GET_FILENAME_COMPONENT(pch_header "${_f}" ABSOLUTE)
     ENDFOREACH()
   ENDIF()
-  IF(MSVC)
+  IF(NOT pch_header)
+    MESSAGE(WARNING "[${TARGET_NAME}] precompiled header [${PRECOMPILED_HEADER}] not found")
+    RETURN()
+  ENDIF()
+  GET_TARGET_PROPERTY(_unity ${TARGET_NAME} UNITY_BUILD)
+  IF(_unity AND NOT (BUILD_PLATFORM_DARWIN OR BUILD_PLATFORM_IOS))
+    # per-source PCH flags would exclude every file from the unity batches
+    TARGET_PRECOMPILE_HEADERS(${TARGET_NAME} PRIVATE ${pch_header})
+  ELSEIF(MSVC)
     ADD_MSVC_PRECOMPILED_HEADER(${TARGET_NAME} ${pch_header})
   ELSEIF(BUILD_PLATFORM_DARWIN OR BUILD_PLATFORM_IOS)
     ADD_XCODE_PRECOMPILED_HEADER(${TARGET_NAME} ${pch_header})
-  # ELSEIF(NOT BUILD_PLATFORM_ANDROID)
-  #   ADD_GCC_PRECOMPILED_HEADER(${TARGET_NAME} ${pch_header})
+  ELSEIF(NOT CMAKE_VERSION VERSION_LESS 3.16)
+    TARGET_PRECOMPILE_HEADERS(${TARGET_NAME} PRIVATE ${pch_header})
+  ELSEIF(CMAKE_GENERATOR MATCHES "Makefiles|Ninja")
+    ADD_GCC_PRECOMPILED_HEADER(${TARGET_NAME} ${pch_header})
   ENDIF()
 ENDFUNCTION()
 
+# Everything that has to match for two targets to share a PCH
+FUNCTION(GET_PCH_FLAGS __out TARGET_NAME)
+  UNSET(pch_flags)
+  FOREACH(_p COMPILE_OPTIONS COMPILE_DEFINITIONS INCLUDE_DIRECTORIES CXX_STANDARD LINK_LIBRARIES)
+    GET_TARGET_PROPERTY(_v ${TARGET_NAME} ${_p})
+    IF(NOT _v)
+      SET(_v "")
+    ENDIF()
+    LIST(APPEND pch_flags "${_p}=${_v}")
+  ENDFOREACH()
+  GET_TARGET_PROPERTY(target_type ${TARGET_NAME} TYPE)
+  GET_TARGET_PROPERTY(pch_pic ${TARGET_NAME} POSITION_INDEPENDENT_CODE)
+  IF(target_type STREQUAL "SHARED_LIBRARY" OR target_type STREQUAL "MODULE_LIBRARY")
+    SET(pch_pic ON)
+  ELSEIF(NOT pch_pic)
+    SET(pch_pic OFF)
+  ENDIF()
+  LIST(APPEND pch_flags "POSITION_INDEPENDENT_CODE=${pch_pic}")
+  SET(${__out} "${pch_flags}" PARENT_SCOPE)
+ENDFUNCTION()
+
+FUNCTION(ADD_SHARED_PRECOMPILED_HEADER __out TARGET_NAME PRECOMPILED_HEADER)
+  GET_TARGET_PROPERTY(source_list ${TARGET_NAME} SOURCES)
+  SET(pch_header "<${PRECOMPILED_HEADER}>")
+  FOREACH(_f ${source_list})
+    GET_FILENAME_COMPONENT(__f ${_f} NAME)
+    IF("${__f}" STREQUAL "${PRECOMPILED_HEADER}")
+      GET_FILENAME_COMPONENT(pch_header "${_f}" ABSOLUTE)
+    ENDIF()
+  ENDFOREACH()
+  GET_PCH_FLAGS(pch_flags ${TARGET_NAME})
+  GET_FILENAME_COMPONENT(pch_base_name ${PRECOMPILED_HEADER} NAME_WE)
+  STRING(MD5 pch_hash "${pch_header}|${pch_flags}")
+  STRING(SUBSTRING ${pch_hash} 0 8 pch_hash)
+  SET(pch_target "pch_${pch_base_name}_${pch_hash}")
+  IF(NOT TARGET ${pch_target})
+    SET(pch_source "${CMAKE_CURRENT_BINARY_DIR}/${pch_target}.cpp")
+    IF(NOT EXISTS ${pch_source})
+      FILE(WRITE ${pch_source} "")
+    ENDIF()
+    ADD_LIBRARY(${pch_target} OBJECT ${pch_source})
+    SET_TARGET_PROPERTIES(${pch_target} PROPERTIES FOLDER "PCH")
+    # Copy the exact flags of the first target, the hash guarantees every
+    # other target reusing it has the same ones
+    FOREACH(_p COMPILE_OPTIONS COMPILE_DEFINITIONS INCLUDE_DIRECTORIES CXX_STANDARD POSITION_INDEPENDENT_CODE)
+      GET_TARGET_PROPERTY(_v ${TARGET_NAME} ${_p})
+      IF(_v)
+        SET_PROPERTY(TARGET ${pch_target} PROPERTY ${_p} "${_v}")
+      ENDIF()
+    ENDFOREACH()
+    GET_TARGET_PROPERTY(target_type ${TARGET_NAME} TYPE)
+    IF(target_type STREQUAL "SHARED_LIBRARY" OR target_type STREQUAL "MODULE_LIBRARY")
+      SET_TARGET_PROPERTIES(${pch_target} PROPERTIES POSITION_INDEPENDENT_CODE ON)
+    ENDIF()
+    GET_TARGET_PROPERTY(pch_libs ${TARGET_NAME} LINK_LIBRARIES)
+    IF(pch_libs)
+      # Usage requirements of linked targets reach the PCH too
+      TARGET_LINK_LIBRARIES(${pch_target} PRIVATE ${pch_libs})
+    ENDIF()
+    TARGET_PRECOMPILE_HEADERS(${pch_target} PRIVATE ${pch_header})
+  ENDIF()
+  SET(${__out} ${pch_target} PARENT_SCOPE)
+ENDFUNCTION()
+
 FUNCTION(ADD_MSVC_PRECOMPILED_HEADER TARGET_NAME PRECOMPILED_HEADER)
   GET_FILENAME_COMPONENT(pch_base_name ${PRECOMPILED_HEADER} NAME_WE)
   GET_FILENAME_COMPONENT(pch_output "${CMAKE_CURRENT_BINARY_DIR}/${CMAKE_CFG_INTDIR}/${pch_base_name}.pch" ABSOLUTE)
@@ -349,7 +519,9 @@ FUNCTION(ADD_GCC_PRECOMPILED_HEADER TARGET_NAME PRECOMPILED_HEADER)
 
 	GET_FILENAME_COMPONENT(PRECOMPILED_HEADER_NAME ${PRECOMPILED_HEADER} NAME)
 
-	SET(PCH_OUTPUT "${CMAKE_CURRENT_BINARY_DIR}/${PRECOMPILED_HEADER_NAME}.gch")
+	SET(PCH_DIR "${CMAKE_CURRENT_BINARY_DIR}/${TARGET_NAME}_pch")
+	SET(PCH_HEADER "${PCH_DIR}/${PRECOMPILED_HEADER_NAME}")
+	SET(PCH_OUTPUT "${PCH_HEADER}.gch")
 
 	SET(include_dirs "$<TARGET_PROPERTY:${TARGET_NAME},INCLUDE_DIRECTORIES>")
 	SET(comp_defs "$<TARGET_PROPERTY:${TARGET_NAME},COMPILE_DEFINITIONS>")
@@ -359,12 +531,13 @@ FUNCTION(ADD_GCC_PRECOMPILED_HEADER TARGET_NAME PRECOMPILED_HEADER)
 	SET(comp_defs "$<$<BOOL:${comp_defs}>:-D$<JOIN:${comp_defs},\n-D>\n>")
 	SET(comp_flags "$<$<BOOL:${comp_flags}>:$<JOIN:${comp_flags},\n>\n>")
 	SET(comp_options "$<$<BOOL:${comp_options}>:$<JOIN:${comp_options},\n>\n>")
-	SET(pch_flags_file "${CMAKE_CURRENT_BINARY_DIR}/compile_flags.rsp")
+	SET(pch_flags_file "${PCH_DIR}/compile_flags.rsp")
 	FILE(GENERATE OUTPUT "${pch_flags_file}" CONTENT "${comp_defs}${include_dirs}${comp_flags}${comp_options}\n")
 	SET(pch_compile_flags "@${pch_flags_file}")
 
 	GET_TARGET_PROPERTY(PIC_OPTION ${TARGET_NAME} POSITION_INDEPENDENT_CODE)
-	IF(PIC_OPTION AND CMAKE_CXX_COMPILE_OPTIONS_PIC)
+	GET_TARGET_PROPERTY(TARGET_TYPE ${TARGET_NAME} TYPE)
+	IF((PIC_OPTION OR TARGET_TYPE STREQUAL "SHARED_LIBRARY" OR TARGET_TYPE STREQUAL "MODULE_LIBRARY") AND CMAKE_CXX_COMPILE_OPTIONS_PIC)
 		LIST(APPEND CXX_COMPILE_FLAGS "${CMAKE_CXX_COMPILE_OPTIONS_PIC}")
 	ENDIF()
 
@@ -375,15 +548,15 @@ FUNCTION(ADD_GCC_PRECOMPILED_HEADER TARGET_NAME PRECOMPILED_HEADER)
 
 	SEPARATE_ARGUMENTS(CXX_COMPILE_FLAGS)
 
-	ADD_CUSTOM_COMMAND(OUTPUT ${CMAKE_CURRENT_BINARY_DIR}/${PRECOMPILED_HEADER_NAME}
-		COMMAND ${CMAKE_COMMAND} -E copy ${PRECOMPILED_HEADER} ${CMAKE_CURRENT_BINARY_DIR}/${PRECOMPILED_HEADER_NAME}
+	ADD_CUSTOM_COMMAND(OUTPUT ${PCH_HEADER}
+		COMMAND ${CMAKE_COMMAND} -E copy ${PRECOMPILED_HEADER} ${PCH_HEADER}
+		DEPENDS ${PRECOMPILED_HEADER}
 	)
 
-	SET(PCHOUTPUT ${CMAKE_CURRENT_BINARY_DIR}/${PRECOMPILED_HEADER_NAME})
-
 	ADD_CUSTOM_COMMAND(OUTPUT ${PCH_OUTPUT}
 		COMMAND ${CMAKE_CXX_COMPILER} ${pch_compile_flags} ${CXX_COMPILE_FLAGS} -o ${PCH_OUTPUT} ${PRECOMPILED_HEADER}
-		DEPENDS ${PRECOMPILED_HEADER} ${CMAKE_CURRENT_BINARY_DIR}/${PRECOMPILED_HEADER_NAME}
+		DEPENDS ${PRECOMPILED_HEADER} ${PCH_HEADER}
+		IMPLICIT_DEPENDS CXX ${PRECOMPILED_HEADER}
 	)
 	ADD_CUSTOM_TARGET(${TARGET_NAME}_gch
 		DEPENDS ${PCH_OUTPUT}
@@ -392,12 +565,10 @@ FUNCTION(ADD_GCC_PRECOMPILED_HEADER TARGET_NAME PRECOMPILED_HEADER)
 
 	GET_PROPERTY(source_list TARGET ${TARGET_NAME} PROPERTY SOURCES)
 	FOREACH(file_name ${source_list})
-		STRING(TOLOWER ${file_name} lower_file_name)
-		STRING(FIND "${lower_file_name}" ".cpp" is_cpp REVERSE)
-		IF(is_cpp GREATER 0)
-			SET_SOURCE_FILES_PROPERTIES(${_source} PROPERTIES
-				COMPILE_FLAGS "-include ${CMAKE_CURRENT_BINARY_DIR}/${PRECOMPILED_HEADER_NAME} -Winvalid-pch"
-				OBJECT_DEPENDS "${PCHOUTPUT}")
+		IF(file_name MATCHES "\\.(cpp|cc|cxx)$")
+			SET_SOURCE_FILES_PROPERTIES(${file_name} PROPERTIES
+				COMPILE_FLAGS "-include ${PCH_HEADER} -Winvalid-pch -Wno-error=invalid-pch"
+				OBJECT_DEPENDS "${PCH_OUTPUT}")
 		ENDIF()
 	ENDFOREACH()
 ENDFUNCTION()
@@ -0,0 +1,56 @@
+# cmake -DSTAGE_SOURCE=<file> -DSTAGE_DESTINATION=<dir> -P StageFile.cmake
+#
+# Stages one file into a directory: unchanged files are left alone, then a
+# hardlink, a reflink and finally a plain copy are tried in that order.
+
+IF(NOT EXISTS "${STAGE_SOURCE}")
+  RETURN()
+ENDIF()
+GET_FILENAME_COMPONENT(_name "${STAGE_SOURCE}" NAME)
+SET(_dst "${STAGE_DESTINATION}/${_name}")
+
+SET(_same FALSE)
+IF(EXISTS "${_dst}")
+  FILE(TIMESTAMP "${STAGE_SOURCE}" _src_time "%Y%m%d%H%M%S" UTC)
+  FILE(TIMESTAMP "${_dst}" _dst_time "%Y%m%d%H%M%S" UTC)
+  IF(NOT CMAKE_VERSION VERSION_LESS 3.14)
+    FILE(SIZE "${STAGE_SOURCE}" _src_size)
+    FILE(SIZE "${_dst}" _dst_size)
+  ENDIF()
+  IF("${_src_time}" STREQUAL "${_dst_time}" AND "${_src_size}" STREQUAL "${_dst_size}")
+    RETURN()
+  ENDIF()
+  EXECUTE_PROCESS(COMMAND ${CMAKE_COMMAND} -E compare_files "${STAGE_SOURCE}" "${_dst}" RESULT_VARIABLE _diff)
+  IF(_diff EQUAL 0)
+    SET(_same TRUE)
+  ENDIF()
+ENDIF()
+
+FILE(MAKE_DIRECTORY "${STAGE_DESTINATION}")
+IF(NOT CMAKE_VERSION VERSION_LESS 3.14)
+  FILE(REMOVE "${_dst}.stage")
+  FILE(CREATE_LINK "${STAGE_SOURCE}" "${_dst}.stage" RESULT _result)
+  IF(_result EQUAL 0)
+    FILE(RENAME "${_dst}.stage" "${_dst}")
+    RETURN()
+  ENDIF()
+ENDIF()
+IF(_same)
+  # Same content but no link possible, only refresh the stamp so the build
+  # step stays up to date
+  FILE(TOUCH_NOCREATE "${_dst}")
+  RETURN()
+ENDIF()
+FILE(REMOVE "${_dst}")
+IF(CMAKE_HOST_UNIX)
+  IF(CMAKE_HOST_APPLE)
+    SET(_reflink -c -p)
+  ELSE()
+    SET(_reflink --reflink=auto --preserve=timestamps)
+  ENDIF()
+  EXECUTE_PROCESS(COMMAND cp ${_reflink} "${STAGE_SOURCE}" "${_dst}" RESULT_VARIABLE _result OUTPUT_QUIET ERROR_QUIET)
+  IF(_result EQUAL 0)
+    RETURN()
+  ENDIF()
+ENDIF()
+FILE(COPY "${STAGE_SOURCE}" DESTINATION "${STAGE_DESTINATION}")